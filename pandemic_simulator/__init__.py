@@ -0,0 +1,15 @@
+from .model import Individual, RandomWalkModel, State
+from .vectorized import BatchedRandomWalkModel, VectorizedRandomWalkModel, simulateRuns
+from .tiled import TiledRandomWalkModel
+from .decomposed import DecomposedRandomWalkModel
+from .network import ContactNetwork, NetworkRandomWalkModel, readEdgeList, writeEdgeList
+from .parallel import adaptiveRuns, parallelRuns
+from .transitions import TransitionTable
+from .results import ChunkedTimeSeriesWriter, CsvTimeSeriesWriter, openTimeSeriesWriter, readTimeSeries
+from .images import AnimationRecorder, gridImage
+from .aggregate import RunningStatistics
+from .reports import writeExcelReport, writePdfReport
+from .instrumentation import Instrumentation
+from .scenario import Scenario, availableScenarios, loadScenario
+from .checkpoint import BatchCheckpoint, loadModel, saveModel
+from .cli import runBatch
@@ -0,0 +1,81 @@
+import math
+import random
+from collections import Counter
+
+class RunningStatistics:
+    # Summary statistics of a stream of runs, one value per column, updated
+    # as each run finishes without keeping the runs themselves: Welford's
+    # running mean and variance, min/max, and a histogram of the values seen
+    # per column (state counts are integers bounded by the grid size, so the
+    # histograms stay small and give exact percentiles). Optionally keeps a
+    # uniform reservoir sample of sampleSize runs for per-run tables.
+    def __init__(self, columns, sampleSize=0, seed=0):
+        self.columns = list(columns)
+        self.count = 0
+        self.mean = [0.0] * len(self.columns)
+        self.squares = [0.0] * len(self.columns) # Sum of squared deviations from the mean
+        self.minimum = [None] * len(self.columns)
+        self.maximum = [None] * len(self.columns)
+        self.histograms = [Counter() for _ in self.columns]
+        self.sampleSize = sampleSize
+        self.sample = []
+        self.random = random.Random(seed)
+
+    def add(self, row, run=None):
+        self.count += 1
+        for index, value in enumerate(row):
+            delta = value - self.mean[index]
+            self.mean[index] += delta / self.count
+            self.squares[index] += delta * (value - self.mean[index])
+            if self.minimum[index] is None or value < self.minimum[index]:
+                self.minimum[index] = value
+            if self.maximum[index] is None or value > self.maximum[index]:
+                self.maximum[index] = value
+            self.histograms[index][value] += 1
+
+        run = self.count if run is None else run
+        if len(self.sample) < self.sampleSize:
+            self.sample.append((run, list(row)))
+        elif self.sampleSize:
+            slot = self.random.randrange(self.count)
+            if slot < self.sampleSize:
+                self.sample[slot] = (run, list(row))
+
+    def addAll(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def variance(self):
+        if self.count < 2:
+            return [0.0] * len(self.columns)
+        return [squares / (self.count - 1) for squares in self.squares]
+
+    def standardDeviation(self):
+        return [math.sqrt(variance) for variance in self.variance()]
+
+    def confidenceInterval(self, z=1.96):
+        # Normal-approximation interval for the mean (95% by default).
+        if self.count == 0:
+            return [(0.0, 0.0)] * len(self.columns)
+        return [
+            (mean - z * deviation / math.sqrt(self.count), mean + z * deviation / math.sqrt(self.count))
+            for mean, deviation in zip(self.mean, self.standardDeviation())
+        ]
+
+    def percentile(self, q):
+        # Nearest-rank percentile of every column, q in [0, 100].
+        rank = max(1, math.ceil(q / 100 * self.count))
+        percentiles = []
+        for histogram in self.histograms:
+            seen = 0
+            value = None
+            for value in sorted(histogram):
+                seen += histogram[value]
+                if seen >= rank:
+                    break
+            percentiles.append(value)
+        return percentiles
+
+    def sampledRuns(self):
+        # The kept runs in run order, as (run, row) pairs.
+        return sorted(self.sample, key=lambda item: item[0])
@@ -0,0 +1,269 @@
+import argparse
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .model import CONTAGION_FACTOR, DEAD, HEALTHY, SICK, SOCIAL_DISTANCE_EFFECT, TRANSITION_PROBABILITIES, State
+from .parallel import runChunks, runSeeds
+from .scenario import loadScenario
+from .transitions import TransitionTable
+
+# Approximate engine for quick what-if screening: the expected number of
+# cells in every state per generation, from the same parameters as the
+# simulation, in milliseconds instead of a batch of spatial runs. Run with
+#
+#     python -m pandemic_simulator.approximate lockdown --runs 100 --calibrate
+#
+# to see how far it is from the full model for a scenario before using it.
+
+class PairApproximationModel:
+    # Pair approximation of the grid model. The state is the density of
+    # every ordered pair of states on Moore neighbours (and so of every
+    # single state), instead of one cell each; a generation updates the
+    # pairs assuming that, given a cell's state, its other neighbours are
+    # independent with the pair densities' conditional distribution. This
+    # keeps the correlation between neighbours that makes an epidemic on a
+    # grid grow from a front, which a mean-field (well-mixed) model loses.
+    #
+    # An infection moves at most one cell per generation, so the densities
+    # only describe the square the epidemic can have reached: the bounding
+    # box of the cells that were not healthy at the start, grown by one cell
+    # on every side per generation (as healthy cells with healthy
+    # neighbours). Without it, the approximation grows exponentially over
+    # the whole grid and overshoots the full model many times over.
+    #
+    # The rule is that of the synchronous mode: healthy and dead cells keep
+    # their state, the others follow the transition matrix, and a cell that
+    # is healthy after that is exposed to every sick neighbour and escapes
+    # with probability (1 - (1 - socialDistanceEffect) * contagionFactor)
+    # ** exposures. neighbours is the effective number of neighbours, 8 for
+    # the Moore neighbourhood; calibrate() fits it to the full model.
+    #
+    # report() and history hold expected counts (floats) in State order,
+    # like the other engines' counts, so they can be compared directly.
+    def __init__(self, populationMatrixSize, neighbours=8):
+        self.size = populationMatrixSize
+        self.neighbours = neighbours
+        self.currentGeneration = 0
+        self.transitionProbabilities = TRANSITION_PROBABILITIES
+        self.contagionFactor = CONTAGION_FACTOR
+        self.socialDistanceEffect = SOCIAL_DISTANCE_EFFECT
+
+        codes = np.full((populationMatrixSize, populationMatrixSize), HEALTHY, dtype=np.uint8)
+        codes[populationMatrixSize // 2, populationMatrixSize // 2] = SICK
+        self.loadPopulation(codes)
+
+    @property
+    def transitionProbabilities(self):
+        return [row[:] for row in self.transitions.probabilities]
+
+    @transitionProbabilities.setter
+    def transitionProbabilities(self, transitionProbabilities):
+        self.transitions = TransitionTable(transitionProbabilities, len(State))
+        # Distribution of a cell's state after its own transition: healthy
+        # and dead cells are not sampled by the engines, so they stay.
+        self.ownTransitions = np.array(self.transitions.probabilities, dtype=float)
+        for state in (HEALTHY, DEAD):
+            self.ownTransitions[state] = np.eye(len(State))[state]
+
+    def loadPopulation(self, codes):
+        # Starts from a grid of state codes (N x N): the single densities of
+        # the bounding box of its cells that are not healthy, and the pair
+        # densities of those cells with all their Moore neighbours.
+        codes = np.asarray(codes, dtype=np.uint8).reshape(self.size, self.size)
+        lines, columns = np.nonzero(codes != HEALTHY)
+        if lines.size == 0:
+            self.box = [0, self.size - 1, 0, self.size - 1]
+        else:
+            self.box = [int(lines.min()), int(lines.max()), int(columns.min()), int(columns.max())]
+        top, bottom, left, right = self.box
+        padded = np.full((self.size + 2, self.size + 2), len(State), dtype=np.uint8) # Outside the grid
+        padded[1:-1, 1:-1] = codes
+        inside = codes[top:bottom + 1, left:right + 1]
+        pairs = np.zeros((len(State) + 1, len(State) + 1))
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                if di or dj:
+                    neighbours = padded[top + 1 + di:bottom + 2 + di, left + 1 + dj:right + 2 + dj]
+                    np.add.at(pairs, (inside.ravel(), neighbours.ravel()), 1)
+        pairs = pairs[:len(State), :len(State)]
+        pairs = (pairs + pairs.T) / 2
+        self.pairCount = pairs.sum()
+        self.pairs = pairs / self.pairCount
+        self.region = inside.size
+        self.singles = np.bincount(inside.ravel(), minlength=len(State)) / self.region
+        self.history = [self.report()]
+
+    def expand(self):
+        # Grows the reachable square by one cell on every side, adding the
+        # new cells as healthy and their pairs as healthy-healthy.
+        top, bottom, left, right = self.box
+        self.box = [max(0, top - 1), min(self.size - 1, bottom + 1), max(0, left - 1), min(self.size - 1, right + 1)]
+        top, bottom, left, right = self.box
+        region = (bottom - top + 1) * (right - left + 1)
+        added = region - self.region
+        if added:
+            singles = self.singles * self.region
+            singles[HEALTHY] += added
+            pairs = self.pairs * self.pairCount
+            pairs[HEALTHY, HEALTHY] += 8 * added
+            self.pairCount += 8 * added
+            self.region = region
+            self.singles = singles / region
+            self.pairs = pairs / self.pairCount
+
+    def nextGeneration(self):
+        self.expand()
+        contagion = (1 - self.socialDistanceEffect) * self.contagionFactor
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sickNeighbour = np.nan_to_num(self.pairs[:, SICK] / self.pairs.sum(axis=1)) # P(neighbour sick | own state)
+        others = (1 - contagion * sickNeighbour) ** (self.neighbours - 1) # Escape from the other neighbours
+
+        # outcome[a, b, c]: probability that a cell in state a with a
+        # neighbour in state b goes to c.
+        escape = others[:, np.newaxis] * np.where(np.arange(len(State)) == SICK, 1 - contagion, 1.0)[np.newaxis, :]
+        outcome = np.repeat(self.ownTransitions[:, np.newaxis, :], len(State), axis=1)
+        healthy = outcome[:, :, HEALTHY].copy()
+        outcome[:, :, HEALTHY] = healthy * escape
+        outcome[:, :, SICK] += healthy * (1 - escape)
+
+        # Both cells of a pair move independently given the pair.
+        self.pairs = np.einsum('ab,abx,bay->xy', self.pairs, outcome, outcome)
+        singleEscape = others * (1 - contagion * sickNeighbour)
+        singles = self.singles @ self.ownTransitions
+        afterTransitions = self.singles[:, np.newaxis] * self.ownTransitions
+        recovered = afterTransitions[:, HEALTHY] # Healthy after their own transition, by previous state
+        singles[HEALTHY] = (recovered * singleEscape).sum()
+        singles[SICK] += (recovered * (1 - singleEscape)).sum()
+        self.singles = singles
+        self.currentGeneration += 1
+        self.history.append(self.report())
+
+    def report(self):
+        # The cells the epidemic cannot have reached are still healthy.
+        cases = self.singles * self.region
+        cases[HEALTHY] += self.size * self.size - self.region
+        return cases.tolist()
+
+    def numberOfDeaths(self):
+        return self.singles[DEAD] * self.region
+
+    def simulation(self, generations, verbose=False):
+        for _ in range(generations):
+            self.nextGeneration()
+        if verbose:
+            for report in self.history:
+                print('\t'.join(f"{cases:.1f}" for cases in report))
+
+def approximateHistory(scenario=None, populationMatrixSize=None, generations=None, neighbours=8):
+    # Expected counts per generation (generations + 1 reports) for a
+    # Scenario, with its grid size and generations unless given.
+    populationMatrixSize = populationMatrixSize or (scenario.gridSize if scenario is not None else 156)
+    generations = generations if generations is not None else (scenario.generations if scenario is not None else 52)
+    model = PairApproximationModel(populationMatrixSize, neighbours)
+    if scenario is not None:
+        scenario.apply(model)
+    model.simulation(generations)
+    return np.array(model.history)
+
+def simulatedHistories(scenario, populationMatrixSize, generations, numberOfRuns, seed=None, workers=None, vectorized=False):
+    # Per-generation counts of numberOfRuns full runs, (runs x generations
+    # + 1 x states), by default with RandomWalkModel in its synchronous
+    # mode, the rule the approximation follows.
+    workers = workers or os.cpu_count() or 1
+    seeds = runSeeds(numberOfRuns, seed)
+    chunkSize = max(1, math.ceil(numberOfRuns / (workers * 4)))
+    options = {'scenario': scenario, 'synchronous': True}
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        chunkResults = runChunks(executor, populationMatrixSize, generations, seeds, 0, numberOfRuns, chunkSize, vectorized, options)
+        return np.array([history for chunk in chunkResults for _, history, _ in chunk], dtype=float)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+def approximationError(approximate, histories):
+    # Error of an approximate history against simulated ones, as fractions
+    # of the population per state: the mean and largest absolute error of
+    # the trajectory against the simulated mean, the error at the last
+    # generation, and the share of generations where the approximation is
+    # outside the simulated 95% interval of the mean.
+    population = histories[0, 0].sum()
+    mean = histories.mean(axis=0)
+    deviation = histories.std(axis=0, ddof=1) if len(histories) > 1 else np.zeros_like(mean)
+    halfWidth = 1.96 * deviation / math.sqrt(len(histories))
+    error = np.abs(approximate - mean) / population
+    return {
+        'meanError': error.mean(axis=0).tolist(),
+        'maximumError': error.max(axis=0).tolist(),
+        'finalError': error[-1].tolist(),
+        'outsideInterval': (np.abs(approximate - mean) > halfWidth + 0.5).mean(axis=0).tolist(),
+    }
+
+def validateApproximation(scenario, numberOfRuns=100, populationMatrixSize=None, generations=None, neighbours=8, seed=None, workers=None,
+                          vectorized=False, histories=None):
+    # Runs the full model (or uses the given histories) and measures the
+    # error of the approximation against it. Returns approximationError()
+    # with the two mean trajectories.
+    populationMatrixSize = populationMatrixSize or scenario.gridSize
+    generations = generations if generations is not None else scenario.generations
+    if histories is None:
+        histories = simulatedHistories(scenario, populationMatrixSize, generations, numberOfRuns, seed, workers, vectorized)
+    approximate = approximateHistory(scenario, populationMatrixSize, generations, neighbours)
+    result = approximationError(approximate, histories)
+    result.update(neighbours=neighbours, approximate=approximate.tolist(), simulated=histories.mean(axis=0).tolist())
+    return result
+
+def calibrate(scenario, numberOfRuns=100, populationMatrixSize=None, generations=None, seed=None, workers=None, vectorized=False,
+              candidates=np.linspace(2, 8, 61)):
+    # Fits the effective number of neighbours to one batch of full runs
+    # (the value with the smallest mean error over every state and
+    # generation) and returns validateApproximation() for it.
+    populationMatrixSize = populationMatrixSize or scenario.gridSize
+    generations = generations if generations is not None else scenario.generations
+    histories = simulatedHistories(scenario, populationMatrixSize, generations, numberOfRuns, seed, workers, vectorized)
+    mean = histories.mean(axis=0)
+    errors = [
+        np.abs(approximateHistory(scenario, populationMatrixSize, generations, neighbours) - mean).mean()
+        for neighbours in candidates
+    ]
+    best = float(candidates[int(np.argmin(errors))])
+    return validateApproximation(scenario, populationMatrixSize=populationMatrixSize, generations=generations, neighbours=best, histories=histories)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pandemic_simulator.approximate', description='Check the pair approximation against the full model.')
+    parser.add_argument('scenario', nargs='?', default='lockdown', help='scenario name or .json file')
+    parser.add_argument('--runs', type=int, default=100, help='full runs to compare with')
+    parser.add_argument('--grid-size', type=int)
+    parser.add_argument('--generations', type=int)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--workers', type=int, default=0, help='worker processes (0 for one per CPU)')
+    parser.add_argument('--engine', choices=['object', 'vectorized'], default='vectorized', help='engine of the full runs')
+    parser.add_argument('--neighbours', type=float, default=8, help='effective number of neighbours')
+    parser.add_argument('--calibrate', action='store_true', help='fit the effective number of neighbours first')
+    args = parser.parse_args(argv)
+
+    try:
+        scenario = loadScenario(args.scenario)
+    except ValueError as error:
+        parser.error(str(error))
+    options = dict(numberOfRuns=args.runs, populationMatrixSize=args.grid_size, generations=args.generations, seed=args.seed,
+                   workers=args.workers or None, vectorized=args.engine == 'vectorized')
+    result = calibrate(scenario, **options) if args.calibrate else validateApproximation(scenario, neighbours=args.neighbours, **options)
+
+    from tabulate import tabulate
+    headers = ['Error (% of population)'] + [state.name.capitalize() for state in State]
+    table = [
+        [label] + [round(100 * value, 2) for value in result[key]]
+        for label, key in (('Mean', 'meanError'), ('Maximum', 'maximumError'), ('Final', 'finalError'))
+    ]
+    table.append(['Outside the 95% interval (% of generations)'] + [round(100 * value) for value in result['outsideInterval']])
+    print(f"Vizinhos efetivos: {result['neighbours']:g}")
+    print(tabulate(table, headers=headers, tablefmt="grid"))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
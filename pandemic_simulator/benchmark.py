@@ -0,0 +1,193 @@
+import argparse
+import functools
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .aggregate import RunningStatistics
+from .decomposed import DecomposedRandomWalkModel
+from .model import RandomWalkModel, State
+from .network import ContactNetwork, NetworkRandomWalkModel
+from .tiled import TiledRandomWalkModel
+from .vectorized import BatchedRandomWalkModel, VectorizedRandomWalkModel
+
+# Stepping throughput of every engine across grid sizes and infection
+# phases, plus image and report export, written as JSON. Run with
+#
+#     python -m pandemic_simulator.benchmark --output bench.json
+#     python -m pandemic_simulator.benchmark --compare bench.json
+#
+# Each result is the best time over the repeats, in seconds per call.
+
+SIZES = [64, 256, 1024, 2048]
+PHASES = ['early', 'saturated']
+BATCH_REPLICAS = 8
+OBJECT_MAX_SIZE = 1024 # The pure Python engines take minutes per generation above this
+
+@functools.lru_cache(maxsize=1)
+def gridNetwork(size):
+    # Built once per size, outside the timings: the network engine is timed
+    # on the contacts of the grid, not on building them.
+    return ContactNetwork.grid(size)
+
+# The tiled engine works in a temporary directory and the decomposed one
+# starts its worker processes; both are closed after use (see closeModel).
+ENGINES = {
+    'object': lambda size: RandomWalkModel(size),
+    'sparse': lambda size: RandomWalkModel(size, sparse=True),
+    'vectorized': lambda size: VectorizedRandomWalkModel(size),
+    'batched': lambda size: BatchedRandomWalkModel(BATCH_REPLICAS, size),
+    'tiled': lambda size: TiledRandomWalkModel(size),
+    'decomposed': lambda size: DecomposedRandomWalkModel(size),
+    'network': lambda size: NetworkRandomWalkModel(gridNetwork(size)),
+}
+
+# Share of every state in the synthetic "saturated" grid, an epidemic that
+# has spread over the whole population.
+SATURATED_SHARES = [0.4, 0.2, 0.1, 0.2, 0.1]
+
+def earlyGrid(size):
+    grid = np.zeros((size, size), dtype=np.uint8)
+    grid[size // 2, size // 2] = State.sick.value
+    return grid
+
+def saturatedGrid(size, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.choice(len(State), size=(size, size), p=SATURATED_SHARES).astype(np.uint8)
+
+def closeModel(model):
+    close = getattr(model, 'close', None)
+    if close is not None:
+        close()
+
+def bestTime(function, repeat, setup=None):
+    best = float('inf')
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def benchmarkEngine(name, size, phase, repeat):
+    results = {}
+    build = ENGINES[name]
+    if phase == 'early':
+        built = []
+        try:
+            results['construct'] = bestTime(lambda: built.append(build(size)), repeat)
+        finally:
+            for model in built:
+                closeModel(model)
+    model = build(size)
+    try:
+        if phase == 'early':
+            results['reset'] = bestTime(model.reset, repeat)
+        grid = saturatedGrid(size) if phase == 'saturated' else earlyGrid(size)
+
+        results['nextGeneration'] = bestTime(model.nextGeneration, repeat, lambda: model.loadPopulation(grid))
+        results['report'] = bestTime(model.report, repeat)
+        results['image'] = bestTime(lambda: model.image().save(io.BytesIO(), format='PNG'), repeat)
+    finally:
+        closeModel(model)
+    return results
+
+def benchmarkReports(runs, repeat):
+    # Report export does not depend on the engine: time it on a synthetic
+    # batch of runs. Exporters whose library is missing are skipped.
+    from .reports import writeExcelReport, writePdfReport
+
+    rng = np.random.default_rng(0)
+    statistics = RunningStatistics([state.name for state in State] + ['deaths'], sampleSize=1000)
+    for row in rng.integers(0, 24336, size=(runs, len(State) + 1)).tolist():
+        statistics.add(row)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, writer, extension in [('pdfReport', writePdfReport, 'pdf'), ('excelReport', writeExcelReport, 'xlsx')]:
+            try:
+                results[name] = bestTime(lambda: writer(os.path.join(directory, f'report.{extension}'), statistics), repeat)
+            except ImportError as error:
+                print(f"skipping {name}: {error}", file=sys.stderr)
+    return results
+
+def runBenchmarks(sizes=SIZES, engines=tuple(ENGINES), phases=PHASES, repeat=3, reportRuns=100000, objectMaxSize=OBJECT_MAX_SIZE, verbose=True):
+    results = {}
+    for size in sizes:
+        for engine in engines:
+            if engine in ('object', 'sparse') and size > objectMaxSize:
+                continue
+            for phase in phases:
+                for operation, seconds in benchmarkEngine(engine, size, phase, repeat).items():
+                    key = f'{engine}/{size}/{phase}/{operation}'
+                    results[key] = seconds
+                    if verbose:
+                        print(f'{key:45} {seconds:.6f} s', file=sys.stderr)
+    if reportRuns:
+        for operation, seconds in benchmarkReports(reportRuns, repeat).items():
+            key = f'export/{reportRuns}/{operation}'
+            results[key] = seconds
+            if verbose:
+                print(f'{key:45} {seconds:.6f} s', file=sys.stderr)
+    return {
+        'metadata': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+def compareResults(current, baseline, tolerance=0.2, noise=1e-5):
+    # Returns (key, baseline seconds, current seconds, ratio) for every
+    # benchmark slower than baseline by more than the tolerance. Slowdowns
+    # smaller than noise seconds are timer jitter and are not reported.
+    regressions = []
+    for key, seconds in current['results'].items():
+        before = baseline['results'].get(key)
+        if before and seconds / before > 1 + tolerance and seconds - before > noise:
+            regressions.append((key, before, seconds, seconds / before))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the simulation engines.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--phases', nargs='+', choices=PHASES, default=PHASES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--report-runs', type=int, default=100000, help='runs in the synthetic report export (0 to skip)')
+    parser.add_argument('--object-max-size', type=int, default=OBJECT_MAX_SIZE, help='largest grid for the pure Python engines')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before flagging, as a fraction')
+    args = parser.parse_args(argv)
+
+    current = runBenchmarks(args.sizes, args.engines, args.phases, args.repeat, args.report_runs, args.object_max_size)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(current, file, indent=2)
+    else:
+        json.dump(current, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compareResults(current, baseline, args.tolerance)
+        for key, before, seconds, ratio in regressions:
+            print(f'REGRESSION {key}: {before:.6f} s -> {seconds:.6f} s ({ratio:.2f}x)', file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
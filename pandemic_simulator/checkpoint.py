@@ -0,0 +1,188 @@
+import csv
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .decomposed import DecomposedRandomWalkModel
+from .model import RandomWalkModel
+from .network import NetworkRandomWalkModel
+from .tiled import BYTES_PER_CELL, TiledRandomWalkModel
+from .vectorized import BatchedRandomWalkModel, VectorizedRandomWalkModel
+
+# Checkpoints of single runs and of whole batches, so an interrupted batch
+# can resume where it stopped and end with the same results, bit for bit,
+# as if it had never stopped.
+#
+# A run checkpoint is one uncompressed .npz file: the state grid and the
+# history as raw arrays (written at disk speed even for huge grids) and the
+# rest of getState() (generation, random generator state, parameters) as a
+# JSON string. Files are written to a temporary name and renamed, so a
+# crash during a save leaves the previous checkpoint intact.
+#
+# The grid of the tiled engine is too large for the .npz: its file is
+# copied next to the checkpoint as <name>-<generation>.grid, which the .npz
+# names. The copy is made before the .npz is replaced and older copies are
+# removed after it, so the .npz always names a complete grid. (A hard link
+# would not do: the engine rewrites its grid files in place.)
+#
+# The decomposed engine saves its shared grid in the .npz and the random
+# stream of every worker in the JSON; it is loaded with the same number of
+# workers, and the loaded model must be closed like any other.
+
+GRID_KEYS = ('cells', 'population')
+
+def runCheckpointPath(directory, run):
+    return os.path.join(directory, f'run-{run}.npz')
+
+def gridCopies(path):
+    return glob.glob(glob.escape(path) + '-*.grid')
+
+def saveModel(path, model):
+    state = model.getState()
+    arrays = {'history': np.array(state.pop('history'), dtype=np.int64)}
+    for key in GRID_KEYS:
+        if key in state:
+            arrays[key] = np.frombuffer(state.pop(key), dtype=np.uint8) if key == 'cells' else state.pop(key)
+    if 'gridPath' in state:
+        state['gridFile'] = f"{os.path.basename(path)}-{state['currentGeneration']}.grid"
+        gridCopy = os.path.join(os.path.dirname(path), state['gridFile'])
+        shutil.copyfile(state.pop('gridPath'), gridCopy + '.tmp')
+        os.replace(gridCopy + '.tmp', gridCopy)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        np.savez(file, metadata=np.array(json.dumps(state)), **arrays)
+    os.replace(temporary, path)
+    for copy in gridCopies(path):
+        if os.path.basename(copy) != state.get('gridFile'):
+            os.remove(copy)
+
+def removeModel(path):
+    # Removes a checkpoint and the grid copies that go with it.
+    for copy in [path] + gridCopies(path):
+        if os.path.exists(copy):
+            os.remove(copy)
+
+def loadModel(path, network=None):
+    # network is the ContactNetwork of a NetworkRandomWalkModel, which is
+    # not saved with it.
+    with np.load(path) as data:
+        state = json.loads(str(data['metadata']))
+        for key in data.files:
+            if key != 'metadata':
+                state[key] = data[key]
+    if state['engine'] == 'object':
+        model = RandomWalkModel(state['size'], sparse=state['sparse'])
+    elif state['engine'] == 'vectorized':
+        model = VectorizedRandomWalkModel(state['size'])
+    elif state['engine'] == 'network':
+        if network is None or network.numberOfNodes != state['nodes']:
+            raise ValueError(f"{path} needs the contact network of {state['nodes']} nodes it was saved with")
+        model = NetworkRandomWalkModel(network)
+    elif state['engine'] == 'decomposed':
+        model = DecomposedRandomWalkModel(state['size'], workers=state['workers'])
+    elif state['engine'] == 'tiled':
+        size = state['size']
+        model = TiledRandomWalkModel(size, tileBudget=state['stripeLines'] * size * BYTES_PER_CELL)
+        state['grid'] = np.memmap(os.path.join(os.path.dirname(path), state.pop('gridFile')), dtype=np.uint8, mode='r', shape=(size, size))
+    else:
+        model = BatchedRandomWalkModel(state['replicas'], state['size'])
+    if state['engine'] != 'batched':
+        state['history'] = state['history'].tolist()
+    model.setState(state)
+    return model
+
+def advance(model, generations, path=None, every=None, verbose=False):
+    # Runs model until it reaches generation `generations` (it may start
+    # part-way, from a checkpoint), saving it to path every `every`
+    # generations.
+    if model.currentGeneration == 0:
+        model.logHeaders(verbose)
+        model.logReport(verbose)
+    while model.currentGeneration < generations:
+        model.nextGeneration()
+        model.logReport(verbose)
+        if path and every and model.currentGeneration % every == 0 and model.currentGeneration < generations:
+            saveModel(path, model)
+
+class BatchCheckpoint:
+    # Directory with the progress of a batch: batch.json holds its settings
+    # and seed, runs.csv the final row of every finished run in run order
+    # (appended and flushed as runs finish), and run-N.npz the last
+    # checkpoint of every run still in progress, saved every `every`
+    # generations.
+    def __init__(self, directory, every=10, resume=False):
+        self.directory = directory
+        self.every = every
+        self.resume = resume
+        self.file = None
+
+    def start(self, settings, seed=None, group=1):
+        # Returns the rows of the runs already finished and the seed of the
+        # batch: the stored one when resuming, otherwise seed (or fresh
+        # entropy when it is None, so that a resumed batch draws the same
+        # random numbers). The settings (which include numberOfRuns) must
+        # match the stored ones. Runs that finish together in groups of
+        # `group` rows are only kept whole, and so is a row cut short by a
+        # crash.
+        settings = json.loads(json.dumps(settings))
+        path = os.path.join(self.directory, 'batch.json')
+        if os.path.exists(path):
+            if not self.resume:
+                raise ValueError(f"{self.directory} already holds a checkpoint, resume it or use another directory")
+            with open(path) as file:
+                stored = json.load(file)
+            if seed is not None and seed != stored['seed']:
+                raise ValueError(f"checkpoint in {self.directory} was written with seed {stored['seed']}, not {seed}")
+            if stored['settings'] != settings:
+                raise ValueError(f"checkpoint in {self.directory} was written for other settings: {stored['settings']}")
+            seed = stored['seed']
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            seed = np.random.SeedSequence(seed).entropy
+            temporary = path + '.tmp'
+            with open(temporary, 'w') as file:
+                json.dump({'settings': settings, 'seed': seed}, file, indent=2)
+            os.replace(temporary, path)
+
+        rowsPath = os.path.join(self.directory, 'runs.csv')
+        lines = []
+        if os.path.exists(rowsPath):
+            with open(rowsPath, newline='') as file:
+                text = file.read()
+            lines = text.splitlines(keepends=True)
+            complete = [line for line in lines if line.endswith('\n')]
+            if len(complete) < settings['numberOfRuns']:
+                complete = complete[:len(complete) - len(complete) % group]
+            if len(complete) != len(lines):
+                with open(rowsPath, 'w', newline='') as file:
+                    file.writelines(complete)
+            lines = complete
+        rows = [[int(value) for value in row] for row in csv.reader(lines)]
+        self.file = open(rowsPath, 'a', newline='')
+        self.writer = csv.writer(self.file)
+        return rows, seed
+
+    def runPath(self, run):
+        return runCheckpointPath(self.directory, run)
+
+    def complete(self, run, *rows):
+        # Records the rows of a run (or of a group of runs saved together
+        # under the number of the first one). Its checkpoint is only removed
+        # once the rows are on disk.
+        self.writer.writerows(rows)
+        self.file.flush()
+        removeModel(self.runPath(run))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,143 @@
+import argparse
+import os
+import sys
+
+from .aggregate import RunningStatistics
+from .checkpoint import BatchCheckpoint
+from .instrumentation import Instrumentation
+from .model import DEAD, State
+from .parallel import adaptiveRuns, parallelRuns
+from .reports import writeExcelReport, writePdfReport
+from .results import openTimeSeriesWriter
+from .scenario import Scenario, availableScenarios, loadScenario
+from .vectorized import simulateRuns
+
+# Batch runner behind "python -m pandemic_simulator" and the scripts. The
+# report modules only import fpdf, openpyxl and tabulate when the matching
+# output is written, so short runs and worker processes start without them.
+
+ENGINES = ['object', 'vectorized', 'batched']
+
+HEADERS = [state.name.capitalize() for state in State] + ['Deaths']
+
+def printAverages(statistics):
+    from tabulate import tabulate # Certifique-se de que a biblioteca está instalada (pip install tabulate)
+
+    print("\n" + "="*40)
+    print("MÉDIA FINAL DAS SIMULAÇÕES (CONSOLE):")
+    print("="*40)
+    print(tabulate([[round(value) for value in statistics.mean]], headers=statistics.columns, tablefmt="grid"))
+
+def runBatch(scenario='lockdown', numberOfRuns=1000, gridSize=None, generations=None, engine='object', workers=1, seed=None,
+             verbose=False, reportRuns=1000, timeSeriesFile=None, timeSeriesFormat='csv', pdfFile=None, excelFile=None,
+             imageDirectory=None, metricsFile=None, console=True, checkpointDirectory=None, checkpointEvery=10, resume=False,
+             tolerance=None, metric='deaths', relative=False):
+    # Runs numberOfRuns simulations of a scenario (a Scenario, a shipped
+    # scenario name or a scenario file) and writes the requested outputs.
+    # gridSize and generations default to the scenario's. With a
+    # checkpointDirectory the batch can be stopped and run again with
+    # resume=True to continue it. With a tolerance, runs stop as soon as the
+    # 95% confidence interval of the mean of metric (a column name) is
+    # within +/- tolerance (a fraction of the mean if relative), and
+    # numberOfRuns is only the maximum. Returns the RunningStatistics of the
+    # runs.
+    if not isinstance(scenario, Scenario):
+        scenario = loadScenario(scenario)
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}, expected one of: {', '.join(ENGINES)}")
+    if engine == 'batched' and (imageDirectory or metricsFile):
+        raise ValueError("the batched engine does not save images or metrics")
+    if checkpointDirectory and timeSeriesFile and timeSeriesFormat != 'csv':
+        raise ValueError("checkpointed batches can only write csv time series")
+    if tolerance is not None and (engine == 'batched' or checkpointDirectory or imageDirectory):
+        raise ValueError("adaptive batches (with a tolerance) do not support the batched engine, checkpoints or images")
+    columns = [column.lower() for column in HEADERS]
+    if metric not in columns:
+        raise ValueError(f"unknown metric {metric!r}, expected one of: {', '.join(columns)}")
+    gridSize = gridSize or scenario.gridSize
+    generations = generations or scenario.generations
+    if imageDirectory:
+        os.makedirs(imageDirectory, exist_ok=True)
+
+    print(f"Cenário '{scenario.name}': {'até ' if tolerance is not None else ''}{numberOfRuns} simulações de {generations} gerações em uma matriz {gridSize}x{gridSize}")
+    writer = openTimeSeriesWriter(timeSeriesFile, timeSeriesFormat) if timeSeriesFile else None
+    instrumentation = Instrumentation() if metricsFile else None
+    checkpoint = BatchCheckpoint(checkpointDirectory, checkpointEvery, resume) if checkpointDirectory else None
+    try:
+        if tolerance is not None:
+            rows = adaptiveRuns(
+                gridSize, generations, tolerance, columns.index(metric), relative, maximumRuns=numberOfRuns, seed=seed,
+                workers=workers, vectorized=engine == 'vectorized', writer=writer, instrumentation=instrumentation, scenario=scenario,
+            )
+            print(f"Intervalo de confiança atingido após {len(rows)} simulações" if len(rows) < numberOfRuns else "Tolerância não atingida")
+        elif engine == 'batched':
+            reports = simulateRuns(numberOfRuns, gridSize, generations, seed=seed, writer=writer, scenario=scenario, checkpoint=checkpoint)
+            rows = [report + [report[DEAD]] for report in reports.tolist()]
+        else:
+            rows = parallelRuns(
+                numberOfRuns, gridSize, generations, seed, workers, vectorized=engine == 'vectorized', writer=writer,
+                instrumentation=instrumentation, scenario=scenario, imageDirectory=imageDirectory, verbose=verbose,
+                checkpoint=checkpoint,
+            )
+    finally:
+        if writer:
+            writer.close()
+        if checkpoint:
+            checkpoint.close()
+
+    statistics = RunningStatistics(HEADERS, sampleSize=reportRuns)
+    statistics.addAll(rows)
+
+    if metricsFile:
+        instrumentation.writeJson(metricsFile)
+    if pdfFile:
+        writePdfReport(pdfFile, statistics)
+    if excelFile:
+        writeExcelReport(excelFile, statistics)
+    if console:
+        printAverages(statistics)
+    for kind, path in (('PDF', pdfFile), ('Excel', excelFile)):
+        if path:
+            print(f"\nRelatório consolidado em {kind} '{path}' gerado com sucesso.")
+    return statistics
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pandemic_simulator', description='Run a batch of pandemic simulations.')
+    parser.add_argument('scenario', nargs='?', default='lockdown', help=f"scenario name ({', '.join(availableScenarios())}) or .json file")
+    parser.add_argument('--runs', type=int, default=1000)
+    parser.add_argument('--grid-size', type=int, help="grid side (default: the scenario's)")
+    parser.add_argument('--generations', type=int, help="generations per run (default: the scenario's)")
+    parser.add_argument('--engine', choices=ENGINES, default='object')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes (0 for one per CPU)')
+    parser.add_argument('--seed', type=int, help='master seed, for reproducible batches')
+    parser.add_argument('--verbose', action='store_true', help='print every generation')
+    parser.add_argument('--report-runs', type=int, default=1000, help='runs (sampled) listed in the reports')
+    parser.add_argument('--time-series', help='write the per-generation counts of every run to this file or directory')
+    parser.add_argument('--time-series-format', choices=['csv', 'npz', 'parquet'], default='csv')
+    parser.add_argument('--pdf', help='write the PDF report to this file')
+    parser.add_argument('--excel', help='write the Excel report to this file')
+    parser.add_argument('--images', help='save the final grid of every run in this directory')
+    parser.add_argument('--metrics', help='write the instrumentation metrics to this JSON file')
+    parser.add_argument('--checkpoint', help='save the progress of the batch in this directory')
+    parser.add_argument('--checkpoint-every', type=int, default=10, help='generations between checkpoints of a run')
+    parser.add_argument('--resume', action='store_true', help='continue the batch saved in the --checkpoint directory')
+    parser.add_argument('--tolerance', type=float, help='stop once the 95%% confidence interval of the metric is within +/- this (--runs is the maximum)')
+    parser.add_argument('--metric', default='deaths', help='column checked against --tolerance (default: deaths)')
+    parser.add_argument('--relative', action='store_true', help='--tolerance is a fraction of the mean')
+    parser.add_argument('--quiet', action='store_true', help='do not print the averages table')
+    args = parser.parse_args(argv)
+
+    try:
+        runBatch(
+            args.scenario, args.runs, args.grid_size, args.generations, args.engine, args.workers or None, args.seed,
+            args.verbose, args.report_runs, args.time_series, args.time_series_format, args.pdf, args.excel,
+            args.images, args.metrics, console=not args.quiet, checkpointDirectory=args.checkpoint,
+            checkpointEvery=args.checkpoint_every, resume=args.resume, tolerance=args.tolerance, metric=args.metric,
+            relative=args.relative,
+        )
+    except ValueError as error:
+        parser.error(str(error))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
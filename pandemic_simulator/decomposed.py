@@ -0,0 +1,276 @@
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .model import DEAD, HEALTHY, SICK, State, initialCells
+from .philox import TRANSITION, CounterRandom
+from .vectorized import VectorizedRandomWalkModel
+
+def attachGrids(names, size):
+    # The two shared state buffers as N x N arrays, with the blocks that
+    # must stay open while the arrays are used.
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    return blocks, [np.ndarray((size, size), dtype=np.uint8, buffer=block.buf) for block in blocks]
+
+class StripeStepper(VectorizedRandomWalkModel):
+    # Steps lines [first, last) of the shared grid inside a worker process,
+    # with the vectorized engine's stripe steps and its own random stream
+    # (or the counter-based draws shared by every stripe, in synchronous mode).
+    def __init__(self, grids, first, last, seedSequence, counter=None):
+        self.grids = grids
+        self.first = first
+        self.last = last
+        self.rng = np.random.default_rng(seedSequence)
+        self.counter = counter
+        self.currentGeneration = 0
+        self.instrumentation = None
+        self.parameters = None
+        self.transient = None
+
+    def configure(self, parameters):
+        if parameters != self.parameters:
+            self.transitionProbabilities, self.contagionFactor, self.socialDistanceEffect = parameters
+            self.parameters = parameters
+
+    def step(self, current, generation, infectionFree=False, restart=False):
+        # Reads the current grid (its own lines and one halo line on each
+        # side) and writes only its own lines of the other buffer, so the
+        # stripes never write where another one reads or writes. Once the
+        # grid is infection-free, updates its own cells that can still
+        # change in place in the current buffer instead (the list of those
+        # cells is rebuilt on restart, after the grid was replaced).
+        population, nextPopulation = self.grids[current], self.grids[1 - current]
+        size = population.shape[0]
+        self.currentGeneration = generation
+        if infectionFree:
+            return self.transientStep(population[self.first:self.last].reshape(-1), restart, self.first * size)
+        self.transient = None
+        top = 1 if self.first > 0 else 0
+        block = population[self.first - top:min(self.last + 1, size)]
+        stripe = population[self.first:self.last]
+        nextStripe = nextPopulation[self.first:self.last]
+        np.copyto(nextStripe, stripe)
+        states, nextStates = self.computeTransitions(stripe, nextStripe, self.first * size)
+        infected = self.computeInfections(nextStripe, block, top, self.first * size)
+        changes = np.bincount(nextStates, minlength=len(State)) - np.bincount(states, minlength=len(State))
+        changes[HEALTHY] -= infected
+        changes[SICK] += infected
+        return changes
+
+    def transientStep(self, cells, restart, offset):
+        # The vectorized engine's transientTransitions() on the stripe: the
+        # same cells and draws as the full step.
+        if restart or self.transient is None:
+            self.transient = np.flatnonzero((cells != HEALTHY) & (cells != DEAD))
+        states = cells[self.transient]
+        nextStates = self.transitions.sampleTransitions(states, self.uniforms(TRANSITION, self.transient + offset))
+        cells[self.transient] = nextStates
+        self.transient = self.transient[(nextStates != HEALTHY) & (nextStates != DEAD)]
+        return np.bincount(nextStates, minlength=len(State)) - np.bincount(states, minlength=len(State))
+
+def stripeSeeds(seed, workers):
+    # The random stream of every stripe, spawned from the model's seed.
+    return np.random.SeedSequence(seed).spawn(workers)
+
+def stripeWorker(connection, names, size, first, last, seedSequence, counter=None):
+    # Serves ('step', current, generation, parameters, infectionFree,
+    # restart), ('reset', seedSequence, counter), ('state',) (answered with
+    # the state of its random stream) and ('setState', random, counter)
+    # messages until it receives None.
+    blocks, grids = attachGrids(names, size)
+    stepper = StripeStepper(grids, first, last, seedSequence, counter)
+    try:
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            if message[0] == 'reset':
+                _, seedSequence, counter = message
+                stepper = StripeStepper(grids, first, last, seedSequence, counter)
+                continue
+            if message[0] == 'state':
+                connection.send(stepper.rng.bit_generator.state)
+                continue
+            if message[0] == 'setState':
+                _, stepper.rng.bit_generator.state, stepper.counter = message
+                stepper.transient = None
+                continue
+            _, current, generation, parameters, infectionFree, restart = message
+            stepper.configure(parameters)
+            connection.send(stepper.step(current, generation, infectionFree, restart))
+    finally:
+        del stepper, grids
+        for block in blocks:
+            block.close()
+        connection.close()
+
+class DecomposedRandomWalkModel(VectorizedRandomWalkModel):
+    # One grid stepped by several worker processes, each owning a stripe of
+    # consecutive lines. Both state buffers live in shared memory, so no
+    # grid data is copied between processes; a generation is one message
+    # to every worker and one reply with the change in its state counts,
+    # which is the barrier between generations.
+    #
+    # Updates are synchronous: every stripe reads only the current buffer
+    # (halo lines included) and writes only its own lines of the next one.
+    # Infections are pulled rather than pushed, as in the vectorized engine
+    # (a healthy cell counts its sick neighbours), so an infection across a
+    # stripe boundary is written by the stripe that owns the infected cell
+    # and no two processes ever write the same byte.
+    #
+    # Each worker has its own random stream spawned from seed, so a seed
+    # gives the same run for the same number of workers; the results follow
+    # the distribution of VectorizedRandomWalkModel for any number. In
+    # synchronous mode, every worker draws from the same counter-based
+    # generator, keyed by cell, and any number of workers gives the grid of
+    # VectorizedRandomWalkModel(synchronous=True) for the same seed. Call
+    # close() (or use a with block) to stop the workers and free the memory.
+    def __init__(self, populationMatrixSize, workers=None, seed=None, debug=False, synchronous=False, initialInfected=None):
+        self.initModel(seed, debug, synchronous, initialInfected) # The counter is sent to every worker
+        workers = min(workers or os.cpu_count() or 1, populationMatrixSize)
+        self.transient = None # True once the workers step an infection-free grid in place
+
+        self.blocks = [shared_memory.SharedMemory(create=True, size=populationMatrixSize * populationMatrixSize) for _ in range(2)]
+        self.grids = [np.ndarray((populationMatrixSize, populationMatrixSize), dtype=np.uint8, buffer=block.buf) for block in self.blocks]
+        for grid in self.grids:
+            grid[...] = HEALTHY
+        self.current = 0
+        for grid in self.grids:
+            grid.flat[initialCells(populationMatrixSize, initialInfected, seed)] = SICK
+
+        bounds = np.linspace(0, populationMatrixSize, workers + 1).astype(int)
+        seeds = stripeSeeds(seed, workers)
+        names = [block.name for block in self.blocks]
+        self.connections = []
+        self.processes = []
+        for first, last, seedSequence in zip(bounds[:-1], bounds[1:], seeds):
+            connection, workerConnection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=stripeWorker,
+                args=(workerConnection, names, populationMatrixSize, int(first), int(last), seedSequence, self.counter),
+                daemon=True,
+            )
+            process.start()
+            workerConnection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+        self.cases = self.countCases()
+        self.history = [self.report()]
+
+    @property
+    def population(self):
+        return self.grids[self.current]
+
+    @property
+    def nextPopulation(self):
+        return self.grids[1 - self.current]
+
+    def nextGeneration(self):
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.startGeneration()
+        parameters = (self.transitionProbabilities, self.contagionFactor, self.socialDistanceEffect)
+        # Infection-free steps update the current buffer in place; the
+        # workers keep the cells that can still change until the grid is
+        # replaced (self.transient is None again).
+        infectionFree = self.infectionFree()
+        restart = infectionFree and self.transient is None
+        self.transient = True if infectionFree else None
+        for connection in self.connections:
+            connection.send(('step', self.current, self.currentGeneration, parameters, infectionFree, restart))
+        changes = sum(connection.recv() for connection in self.connections)
+        if instrumentation is not None:
+            instrumentation.lap('transitions') # The whole parallel step: the counters stay in the workers
+
+        self.cases += changes
+        if not infectionFree:
+            self.current = 1 - self.current
+        self.currentGeneration += 1
+        self.history.append(self.report())
+        if self.debug:
+            assert np.array_equal(self.cases, self.countCases()), f"running counts {self.cases} differ from the grid"
+        if instrumentation is not None:
+            instrumentation.lap('reporting')
+            instrumentation.finishGeneration(self)
+
+    def loadPopulation(self, codes):
+        codes = np.asarray(codes, dtype=np.uint8).reshape(self.population.shape)
+        if codes.max() >= len(State):
+            raise ValueError(f"invalid state code {codes.max()}")
+        for grid in self.grids:
+            grid[...] = codes
+        self.transient = None
+        self.cases = self.countCases()
+        self.history = [self.report()]
+
+    def reset(self, seed=None, initialInfected=None):
+        # As VectorizedRandomWalkModel.reset(), keeping the workers and the
+        # shared memory: every worker gets the stream (or counter key) it
+        # would have got from a new model with this seed.
+        if self.counter is not None:
+            self.counter = CounterRandom(seed)
+        for connection, seedSequence in zip(self.connections, stripeSeeds(seed, len(self.connections))):
+            connection.send(('reset', seedSequence, self.counter))
+        self.currentGeneration = 0
+        self.current = 0
+        codes = np.full(self.population.shape, HEALTHY, dtype=np.uint8)
+        codes.flat[initialCells(self.population.shape[0], self.initialInfected if initialInfected is None else initialInfected, seed)] = SICK
+        self.loadPopulation(codes)
+
+    def getState(self):
+        # The vectorized engine's state, with the random stream of every
+        # worker (asked for with a 'state' message) instead of one. workers
+        # is kept because the streams are spawned per stripe.
+        for connection in self.connections:
+            connection.send(('state',))
+        return {
+            'engine': 'decomposed',
+            'size': self.population.shape[-1],
+            'workers': len(self.connections),
+            'currentGeneration': self.currentGeneration,
+            'population': self.population.copy(),
+            'history': self.history,
+            'random': [connection.recv() for connection in self.connections],
+            'counter': self.counter.key if self.counter is not None else None,
+            'transitionProbabilities': self.transitionProbabilities,
+            'contagionFactor': self.contagionFactor,
+            'socialDistanceEffect': self.socialDistanceEffect,
+        }
+
+    def setState(self, state):
+        # Needs as many workers as the saved model.
+        if state['workers'] != len(self.connections):
+            raise ValueError(f"state saved with {state['workers']} workers, not {len(self.connections)}")
+        self.loadPopulation(state['population'])
+        self.currentGeneration = state['currentGeneration']
+        self.history = [list(report) for report in state['history']]
+        self.counter = CounterRandom.fromKey(state['counter']) if state.get('counter') else None
+        self.transitionProbabilities = state['transitionProbabilities']
+        self.contagionFactor = state['contagionFactor']
+        self.socialDistanceEffect = state['socialDistanceEffect']
+        for connection, random in zip(self.connections, state['random']):
+            connection.send(('setState', random, self.counter))
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+        if self.blocks:
+            self.grids = []
+            for block in self.blocks:
+                block.close()
+                block.unlink()
+            self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,86 @@
+import os
+import queue
+import threading
+
+from .model import COLORS, State
+
+# Palette indexed by state code, so a state buffer is already the pixel data
+# of a "P" mode image.
+PALETTE = [channel for state in State for channel in COLORS[state]]
+
+def gridImage(buffer, columns, lines):
+    # Builds the image of a row-major buffer of state codes in one call.
+    # Pillow is imported here so that runs without images never load it.
+    from PIL import Image
+
+    img = Image.frombytes("P", (columns, lines), bytes(buffer))
+    img.putpalette(PALETTE)
+    return img
+
+class AnimationRecorder:
+    # Collects one frame per generation while a simulation runs (pass it as
+    # simulation(..., recorder=recorder)) and writes them as an animated
+    # "gif", an animated "png" (APNG), or a directory of numbered "frames".
+    #
+    # capture() only copies the state buffer into a palette image; with
+    # background=True the rest happens on a worker thread, so writing frame
+    # files overlaps with stepping the model. Animated files are written by
+    # close(), since Pillow encodes all their frames in one save.
+    def __init__(self, path, format='gif', duration=200, background=True):
+        if format not in ('gif', 'png', 'frames'):
+            raise ValueError(f"unknown animation format: {format}")
+        if format == 'frames':
+            os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.format = format
+        self.duration = duration # Milliseconds per generation
+        self.frames = []
+        self.count = 0
+        self.queue = None
+        if background:
+            self.queue = queue.Queue(maxsize=64)
+            self.thread = threading.Thread(target=self.work, daemon=True)
+            self.thread.start()
+
+    def capture(self, model):
+        image = model.image()
+        if self.queue is not None:
+            self.queue.put(image)
+        else:
+            self.encode(image)
+
+    def encode(self, image):
+        if self.format == 'frames':
+            image.save(os.path.join(self.path, f"frame-{self.count:04d}.png"))
+        else:
+            self.frames.append(image)
+        self.count += 1
+
+    def work(self):
+        while True:
+            image = self.queue.get()
+            if image is None:
+                break
+            self.encode(image)
+
+    def close(self):
+        if self.queue is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.queue = None
+        if self.frames:
+            self.frames[0].save(
+                self.path,
+                format='GIF' if self.format == 'gif' else 'PNG',
+                save_all=True,
+                append_images=self.frames[1:],
+                duration=self.duration,
+                loop=0,
+            )
+            self.frames = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
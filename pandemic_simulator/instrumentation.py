@@ -0,0 +1,70 @@
+import json
+import time
+from collections import defaultdict
+
+class Instrumentation:
+    # Per-phase timers, counters and per-generation observers for a model.
+    # Attach it with model.instrumentation = Instrumentation(); models leave
+    # the attribute as None by default and then only pay for one check per
+    # generation (and per sick cell in RandomWalkModel).
+    #
+    # Phases are timed as laps: each lap(name) adds the time since the
+    # previous lap to that phase. In RandomWalkModel, infections happen
+    # during the transition sweep, so "socialInteractions" is timed inside
+    # "transitions" and is part of it; the vectorized engines time it as a
+    # phase of its own.
+    #
+    # Counters: cellsVisited (cells whose transition was sampled),
+    # contactsAttempted (neighbours of sick cells, one contact each),
+    # infections (contacts that made a healthy neighbour sick).
+    def __init__(self, timers=True, observers=()):
+        self.timers = timers
+        self.timings = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.observers = list(observers) # Called as observer(model) after every generation
+        self.generations = 0
+        self.last = 0.0
+
+    def addObserver(self, observer):
+        self.observers.append(observer)
+
+    def startGeneration(self):
+        if self.timers:
+            self.last = time.perf_counter()
+
+    def lap(self, phase):
+        if self.timers:
+            now = time.perf_counter()
+            self.timings[phase] += now - self.last
+            self.last = now
+
+    def addTime(self, phase, seconds):
+        if self.timers:
+            self.timings[phase] += seconds
+
+    def count(self, counter, amount=1):
+        self.counters[counter] += amount
+
+    def finishGeneration(self, model):
+        self.generations += 1
+        for observer in self.observers:
+            observer(model)
+
+    def metrics(self):
+        return {
+            'generations': self.generations,
+            'timings': dict(self.timings),
+            'counters': dict(self.counters),
+        }
+
+    def merge(self, metrics):
+        # Adds the metrics() of another run (e.g. from a worker process).
+        self.generations += metrics['generations']
+        for phase, seconds in metrics['timings'].items():
+            self.timings[phase] += seconds
+        for counter, amount in metrics['counters'].items():
+            self.counters[counter] += amount
+
+    def writeJson(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.metrics(), file, indent=2)
@@ -0,0 +1,524 @@
+import enum
+import numbers
+import random
+import time
+
+import numpy as np
+
+from .philox import INFECTION, PLACEMENT, TRANSITION, CounterRandom, escapeProbabilities
+from .transitions import TransitionTable
+
+# Enum class to represent the possible states of an individual in the simulation.
+class State(enum.Enum):
+    healthy = 0
+    sick = 1
+    asymptomatic = 2
+    dead = 3
+    immune = 4
+
+# Parameters of the lockdown variant, used when a model is built without a
+# scenario. The default variant and this one are scenario files in
+# scenarios/ (see scenario.py).
+TRANSITION_PROBABILITIES = [
+    [1.0, 0.0, 0.0, 0.0, 0.0],       # Healthy
+    [0.4, 0.15, 0.23, 0.2, 0.02],    # Sick (was written as ..., 0.12, which sums to 1.1; the sampling always cut it to 0.02)
+    [0.2, 0.0, 0.5, 0.0, 0.3],       # Asymptomatic
+    [0.0, 0.0, 0.0, 1.0, 0.0],       # Dead
+    [0.7, 0.0, 0.0, 0.0, 0.3]        # Immune
+]
+CONTAGION_FACTOR = 0.7 # Probability of getting sick after interaction with a sick individual
+SOCIAL_DISTANCE_EFFECT = 0.5 # Probability of avoiding contact because of social distancing
+
+# Codes stored in the state buffers for each State.
+HEALTHY = State.healthy.value
+SICK = State.sick.value
+ASYMPTOMATIC = State.asymptomatic.value
+DEAD = State.dead.value
+IMMUNE = State.immune.value
+
+# States that can still change on their own; healthy and dead cells only
+# change when a sick neighbour infects them.
+ACTIVE_STATES = (SICK, ASYMPTOMATIC, IMMUNE)
+
+# Translation table marking the bytes of active states with 1, so a buffer
+# can be searched for them without a Python loop over every cell.
+ACTIVE_MARKS = bytes(1 if state in ACTIVE_STATES else 0 for state in range(256))
+
+# Colors used when saving the grid as an image.
+COLORS = {
+    State.healthy: (0, 255, 0),
+    State.sick: (255, 255, 0),
+    State.dead: (255, 0, 0),
+    State.immune: (0, 0, 255),
+    State.asymptomatic: (255, 0, 255)
+}
+
+CENTRE = 'centre' # initialInfected that always means the centre cell, even in reset()
+
+def streamSeed(seed):
+    # Seed of random.Random for a model seed: a np.random.SeedSequence (as
+    # spawned by the runners) gives one 64-bit integer drawn from it, so
+    # the object engine can take the same seeds as the others; counter-based
+    # draws and initial cells still come from the SeedSequence itself.
+    if isinstance(seed, np.random.SeedSequence):
+        return int(seed.generate_state(1, np.uint64)[0])
+    return seed
+
+def randomCells(numberOfCells, count, seed=None):
+    # count distinct cells out of numberOfCells, in increasing order. The
+    # draws are counter-based (see philox.py), keyed by the seed alone, so
+    # every engine picks the same cells for the same seed, and the cost
+    # grows with count, not with the size of the grid.
+    if not 0 <= count <= numberOfCells:
+        raise ValueError(f"cannot infect {count} of {numberOfCells} cells")
+    counter = CounterRandom(seed)
+    cells = np.empty(0, dtype=np.int64)
+    drawn = 0
+    while cells.size < count:
+        draws = counter.uniforms(0, PLACEMENT, np.arange(drawn, drawn + count))
+        drawn += count
+        cells = np.concatenate([cells, np.minimum((draws * numberOfCells).astype(np.int64), numberOfCells - 1)])
+        _, first = np.unique(cells, return_index=True)
+        cells = cells[np.sort(first)] # Repeats dropped, in draw order
+    return np.sort(cells[:count]).tolist()
+
+def initialCells(populationMatrixSize, initialInfected=None, seed=None):
+    # Row-major indices of the cells that are sick at the start of a run:
+    # the centre cell when initialInfected is None or CENTRE, that many
+    # cells picked at random from the seed when it is a number, or the
+    # given (line, column) cells.
+    size = populationMatrixSize
+    if isinstance(initialInfected, str):
+        if initialInfected != CENTRE:
+            raise ValueError(f"unknown initialInfected {initialInfected!r}, expected {CENTRE!r}, a number or a list of cells")
+        initialInfected = None
+    if initialInfected is None:
+        return [(size // 2) * size + size // 2]
+    if isinstance(initialInfected, numbers.Integral):
+        return randomCells(size * size, int(initialInfected), seed)
+    cells = []
+    for line, column in initialInfected:
+        if not (0 <= line < size and 0 <= column < size):
+            raise ValueError(f"cell ({line}, {column}) is outside a {size} x {size} grid")
+        cells.append(line * size + column)
+    return cells
+
+class Individual:
+    def __init__(self, state):
+        self.state = state
+
+# Views that keep the old population[i][j].state access working on top of a
+# state buffer. They hold the model and the buffer name rather than the
+# buffer itself, so they stay valid when the buffers are swapped. Writes go
+# through the model (setCell), which keeps its counts in step.
+class CellView:
+    __slots__ = ('model', 'buffer', 'index')
+
+    def __init__(self, model, buffer, index):
+        self.model = model
+        self.buffer = buffer
+        self.index = index
+
+    @property
+    def state(self):
+        return State(getattr(self.model, self.buffer)[self.index])
+
+    @state.setter
+    def state(self, state):
+        self.model.setCell(self.index, state.value)
+
+class RowView:
+    __slots__ = ('model', 'buffer', 'line')
+
+    def __init__(self, model, buffer, line):
+        self.model = model
+        self.buffer = buffer
+        self.line = line
+
+    def __len__(self):
+        return self.model.size
+
+    def __getitem__(self, column):
+        if not 0 <= column < self.model.size:
+            raise IndexError(column)
+        return CellView(self.model, self.buffer, self.line * self.model.size + column)
+
+class GridView:
+    __slots__ = ('model', 'buffer')
+
+    def __init__(self, model, buffer):
+        self.model = model
+        self.buffer = buffer
+
+    def __len__(self):
+        return self.model.size
+
+    def __getitem__(self, line):
+        if not 0 <= line < self.model.size:
+            raise IndexError(line)
+        return RowView(self.model, self.buffer, line)
+
+class BaseRandomWalkModel:
+    # What every engine shares: the model parameters, the random mode and
+    # the console log of a simulation. The engines differ in how they store
+    # the grid and step it, and provide nextGeneration, report, countCases
+    # and image.
+    def initModel(self, seed=None, debug=False, synchronous=False, initialInfected=None):
+        # The attributes every engine sets up before building its grid.
+        self.currentGeneration = 0
+        self.initialInfected = initialInfected # Used again by reset()
+        self.counter = CounterRandom(seed) if synchronous else None # Draws of the synchronous mode
+        self.debug = debug # Check the running counts against a full scan every generation
+        self.instrumentation = None # Optional Instrumentation collecting timers and counters
+
+        self.transitionProbabilities = TRANSITION_PROBABILITIES
+        self.contagionFactor = CONTAGION_FACTOR
+        self.socialDistanceEffect = SOCIAL_DISTANCE_EFFECT
+
+    @property
+    def transitionProbabilities(self):
+        # A copy: assign a new matrix to change the probabilities.
+        return [row[:] for row in self.transitions.probabilities]
+
+    @transitionProbabilities.setter
+    def transitionProbabilities(self, transitionProbabilities):
+        # Validates the matrix and rebuilds the sampling tables.
+        self.transitions = TransitionTable(transitionProbabilities, len(State))
+        self.infectious = self.transitions.sources(SICK) # States that can still lead to an infection
+
+    def infectionFree(self):
+        # True once no cell is in a state that can lead to a sick one: no
+        # infection can ever happen again, and every cell only follows its
+        # own transitions.
+        return not any(self.cases[state] for state in self.infectious)
+
+    def printReport(self, report):
+        for cases in report:
+            print(cases, '\t', end=' ')
+        print()
+
+    def logHeaders(self, verbose):
+        if verbose:
+            for state in State:
+                print(state.name, '\t', end=' ')
+            print()
+
+    def logReport(self, verbose):
+        if verbose:
+            report = self.report()
+            self.printReport(report)
+
+    def simulation(self, generations, verbose=False, recorder=None):
+        self.logHeaders(verbose)
+        self.logReport(verbose)
+        if recorder:
+            recorder.capture(self)
+
+        for _ in range(generations):
+            self.nextGeneration()
+            self.logReport(verbose)
+            if recorder:
+                recorder.capture(self)
+
+    def numberOfDeaths(self):
+        return int(self.cases[DEAD])
+
+    def printImage(self, name):
+        img = self.image()
+        img.save(f"./images/simulation-{name}.png")
+        img.show()
+
+class RandomWalkModel(BaseRandomWalkModel):
+    def __init__(self, populationMatrixSize, seed=None, sparse=False, debug=False, synchronous=False, initialInfected=None):
+        # The grid is stored row-major as one byte per individual holding its
+        # state code. cells is the current generation and nextCells the one
+        # being written; they are swapped at the end of every generation.
+        #
+        # With synchronous=True, every cell's next state only depends on the
+        # current generation and on counter-based draws keyed by seed,
+        # generation and cell (see philox.py): the cells can be visited in
+        # any order, and every engine in synchronous mode gives the same grid
+        # for the same seed, bit for bit. Transitions are sampled first; then
+        # every cell that is healthy in the next generation (including one
+        # that has just recovered) is exposed to all its sick neighbours in
+        # the current one, and escapes with probability
+        # (1 - (1 - socialDistanceEffect) * contagionFactor) ** exposures.
+        #
+        # initialInfected picks the cells that start sick (see initialCells):
+        # the centre cell by default.
+        self.initModel(seed, debug, synchronous, initialInfected)
+        self.size = populationMatrixSize
+        self.cells = bytearray(populationMatrixSize * populationMatrixSize)
+        self.nextCells = bytearray(populationMatrixSize * populationMatrixSize)
+        self.random = random.Random(streamSeed(seed))
+        self.sparse = sparse # Step only the active cells and their neighbourhoods
+        self.activeCells = None
+
+        for cell in initialCells(populationMatrixSize, initialInfected, seed):
+            self.cells[cell] = SICK
+            self.nextCells[cell] = SICK
+
+        # Running count of every state, kept up to date on each write to
+        # nextCells, and the counts at the end of every generation.
+        self.cases = self.countCases()
+        self.history = [self.report()]
+
+    @property
+    def population(self):
+        return GridView(self, 'cells')
+
+    @property
+    def nextPopulation(self):
+        return GridView(self, 'nextCells')
+
+    def setCell(self, index, state):
+        # Changes a cell between generations (through population[i][j] or
+        # nextPopulation[i][j]): both buffers, the running counts and the
+        # counts of the current generation in history, and the sparse
+        # active set, rebuilt on the next step.
+        self.cases[self.cells[index]] -= 1
+        self.cases[state] += 1
+        self.cells[index] = state
+        self.nextCells[index] = state
+        self.activeCells = None
+        self.history[-1] = self.report()
+
+    def setNextState(self, index, state):
+        self.cases[self.nextCells[index]] -= 1
+        self.cases[state] += 1
+        self.nextCells[index] = state
+
+    def individualTransition(self, line, column):
+        index = line * self.size + column
+        state = self.cells[index]
+        if state == DEAD or state == HEALTHY:
+            return
+        if state == SICK:
+            self.computeSocialInteractions(line, column)
+        self.setNextState(index, self.transitions.sample(state, self.random.random()))
+
+    def computeSickContact(self, index):
+        if self.random.random() <= self.contagionFactor:
+            self.setNextState(index, SICK)
+
+    def neighbourhood(self, line, column):
+        for i in range(max(0, line - 1), min(line + 2, self.size)):
+            for j in range(max(0, column - 1), min(column + 2, self.size)):
+                if i == line and j == column:
+                    continue
+                yield i, j
+
+    def computeSocialInteractions(self, line, column):
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            start = time.perf_counter()
+            sick = self.cases[SICK]
+        for i, j in self.neighbourhood(line, column):
+            if self.socialDistanceEffect < self.random.random():
+                index = i * self.size + j
+                if self.nextCells[index] == HEALTHY:
+                    self.computeSickContact(index)
+        if instrumentation is not None:
+            instrumentation.addTime('socialInteractions', time.perf_counter() - start)
+            instrumentation.count('contactsAttempted', sum(1 for _ in self.neighbourhood(line, column)))
+            instrumentation.count('infections', self.cases[SICK] - sick)
+
+    def findActiveCells(self):
+        marks = self.cells.translate(ACTIVE_MARKS)
+        activeCells = set()
+        index = marks.find(1)
+        while index != -1:
+            activeCells.add(divmod(index, self.size))
+            index = marks.find(1, index + 1)
+        return activeCells
+
+    def swapBuffers(self, touched=None):
+        # Makes the generation just written current and brings the other
+        # buffer back in sync with it: with a bulk copy, or only at the
+        # touched (line, column) cells when those are the only changes.
+        self.cells, self.nextCells = self.nextCells, self.cells
+        if touched is None:
+            self.nextCells[:] = self.cells
+        else:
+            for line, column in touched:
+                index = line * self.size + column
+                self.nextCells[index] = self.cells[index]
+
+    def nextGenerationSparse(self):
+        # Same sweep as the dense step, restricted to the active cells in
+        # row-major order, so it consumes the same random numbers and gives
+        # the same grid. Only active cells and the neighbourhoods of sick
+        # ones can change, so only those are synced between the buffers,
+        # and the next active set is found among them.
+        if self.activeCells is None:
+            self.activeCells = self.findActiveCells()
+        touched = set(self.activeCells)
+        for line, column in self.activeCells:
+            if self.cells[line * self.size + column] == SICK:
+                touched.update(self.neighbourhood(line, column))
+
+        for line, column in sorted(self.activeCells):
+            self.individualTransition(line, column)
+        if self.instrumentation is not None:
+            self.instrumentation.count('cellsVisited', len(self.activeCells))
+            self.instrumentation.lap('transitions')
+
+        self.swapBuffers(touched)
+        self.activeCells = {
+            (line, column)
+            for line, column in touched
+            if self.cells[line * self.size + column] in ACTIVE_STATES
+        }
+
+    def exposeNeighbours(self, activeCells, touched):
+        # Synchronous infections: counts, for every cell that is healthy in
+        # nextCells, its sick neighbours in cells, then draws once per
+        # exposed cell. The draws are keyed by cell, so the order of the
+        # cells does not matter.
+        exposures = {}
+        for line, column in activeCells:
+            if self.cells[line * self.size + column] == SICK:
+                for i, j in self.neighbourhood(line, column):
+                    touched.add((i, j))
+                    index = i * self.size + j
+                    if self.nextCells[index] == HEALTHY:
+                        exposures[index] = exposures.get(index, 0) + 1
+        escape = escapeProbabilities(self.contagionFactor, self.socialDistanceEffect)
+        infected = 0
+        for index, count in exposures.items():
+            if self.counter.uniform(self.currentGeneration, INFECTION, index) >= escape[count]:
+                self.setNextState(index, SICK)
+                infected += 1
+        if self.instrumentation is not None:
+            self.instrumentation.count('contactsAttempted', sum(exposures.values()))
+            self.instrumentation.count('infections', infected)
+
+    def nextGenerationSynchronous(self):
+        # Synchronous step: the transitions of the active cells, then the
+        # infections, both only reading cells. Only the active cells and the
+        # neighbourhoods of sick ones can change, as in the sparse step.
+        if self.activeCells is None:
+            self.activeCells = self.findActiveCells()
+        touched = set(self.activeCells)
+        for line, column in self.activeCells:
+            index = line * self.size + column
+            uniform = self.counter.uniform(self.currentGeneration, TRANSITION, index)
+            self.setNextState(index, self.transitions.sample(self.cells[index], uniform))
+        if self.instrumentation is not None:
+            self.instrumentation.count('cellsVisited', len(self.activeCells))
+            self.instrumentation.lap('transitions')
+        self.exposeNeighbours(self.activeCells, touched)
+        if self.instrumentation is not None:
+            self.instrumentation.lap('socialInteractions')
+
+        self.swapBuffers(touched)
+        self.activeCells = {
+            (line, column)
+            for line, column in touched
+            if self.cells[line * self.size + column] in ACTIVE_STATES
+        }
+
+    def nextGeneration(self):
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.startGeneration()
+        if self.counter is not None:
+            self.nextGenerationSynchronous()
+        elif self.sparse or self.infectionFree():
+            # Without infections, the sparse step only visits the cells that
+            # can still change and gives the same grid as the full sweep.
+            self.nextGenerationSparse()
+        else:
+            for i in range(self.size):
+                for j in range(self.size):
+                    self.individualTransition(i, j)
+            if instrumentation is not None:
+                instrumentation.count('cellsVisited', self.size * self.size)
+                instrumentation.lap('transitions')
+            self.swapBuffers()
+            self.activeCells = None
+        if instrumentation is not None:
+            instrumentation.lap('copyBack')
+        self.currentGeneration += 1
+        self.history.append(self.report())
+        if self.debug:
+            assert self.cases == self.countCases(), f"running counts {self.cases} differ from the grid"
+        if instrumentation is not None:
+            instrumentation.lap('reporting')
+            instrumentation.finishGeneration(self)
+
+    def loadPopulation(self, codes):
+        # Replaces the grid with row-major state codes (bytes, a uint8 array
+        # or a list of ints) and restarts the counts and history from it.
+        codes = bytes(codes)
+        if len(codes) != self.size * self.size:
+            raise ValueError(f"expected {self.size * self.size} state codes, got {len(codes)}")
+        if max(codes) >= len(State):
+            raise ValueError(f"invalid state code {max(codes)}")
+        self.cells[:] = codes
+        self.nextCells[:] = codes
+        self.activeCells = None
+        self.cases = self.countCases()
+        self.history = [self.report()]
+
+    def reset(self, seed=None, initialInfected=None):
+        # Restores the initial condition in place for another run, as if the
+        # model had just been built with this seed and initialInfected (by
+        # default the one it was built with; CENTRE for the centre cell):
+        # the buffers and tables are reused, and the parameters (transition
+        # matrix, contagion factor, social distance effect) and the sparse
+        # and synchronous modes are kept.
+        self.random.seed(streamSeed(seed))
+        if self.counter is not None:
+            self.counter = CounterRandom(seed)
+        self.currentGeneration = 0
+        cells = initialCells(self.size, self.initialInfected if initialInfected is None else initialInfected, seed)
+        for buffer in (self.cells, self.nextCells):
+            buffer[:] = bytes(len(buffer))
+            for cell in cells:
+                buffer[cell] = SICK
+        self.activeCells = None
+        self.cases = self.countCases()
+        self.history = [self.report()]
+
+    def getState(self):
+        # Everything a run needs to continue exactly where it stopped (see
+        # checkpoint.py). The active set of the sparse step is rebuilt from
+        # the grid, which gives the same set.
+        return {
+            'engine': 'object',
+            'size': self.size,
+            'sparse': self.sparse,
+            'currentGeneration': self.currentGeneration,
+            'cells': bytes(self.cells),
+            'history': self.history,
+            'random': self.random.getstate(),
+            'counter': self.counter.key if self.counter is not None else None,
+            'transitionProbabilities': self.transitionProbabilities,
+            'contagionFactor': self.contagionFactor,
+            'socialDistanceEffect': self.socialDistanceEffect,
+        }
+
+    def setState(self, state):
+        self.cells[:] = bytes(state['cells'])
+        self.nextCells[:] = self.cells
+        self.activeCells = None
+        self.currentGeneration = state['currentGeneration']
+        self.history = [list(report) for report in state['history']]
+        version, internal, gauss = state['random']
+        self.random.setstate((version, tuple(internal), gauss))
+        self.counter = CounterRandom.fromKey(state['counter']) if state.get('counter') else None
+        self.transitionProbabilities = state['transitionProbabilities']
+        self.contagionFactor = state['contagionFactor']
+        self.socialDistanceEffect = state['socialDistanceEffect']
+        self.cases = self.countCases()
+
+    def countCases(self):
+        return [self.cells.count(state.value) for state in State]
+
+    def report(self):
+        return self.cases[:]
+
+    def image(self):
+        from .images import gridImage
+        return gridImage(self.cells, self.size, self.size)
@@ -0,0 +1,234 @@
+import math
+import numbers
+
+import numpy as np
+
+from .model import CENTRE, HEALTHY, SICK, State, randomCells
+from .philox import INFECTION, escapeProbabilities
+from .vectorized import VectorizedRandomWalkModel
+
+# Populations on an arbitrary contact network (households, workplaces,
+# long-range links) instead of the square grid. Contacts are stored in CSR
+# form: the neighbours of node v are indices[indptr[v]:indptr[v + 1]].
+#
+# Large networks are read from binary edge lists: a file of little-endian
+# uint32 (source, target) pairs, 8 bytes per edge, written by writeEdgeList
+# (or by anything else, e.g. array.astype('<u4').tofile(path)). The file is
+# mapped, not loaded, and the CSR arrays are built from it in chunks with a
+# counting sort, so memory stays at the size of the CSR arrays (4 bytes per
+# stored edge and 8 per node) plus one chunk.
+
+DEFAULT_CHUNK_EDGES = 1 << 24
+
+class ContactNetwork:
+    def __init__(self, indptr, indices):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.uint32)
+        if self.indptr.ndim != 1 or self.indptr.size == 0 or self.indptr[0] != 0 or self.indptr[-1] != self.indices.size:
+            raise ValueError("indptr must start at 0 and end at the number of stored edges")
+        if np.any(np.diff(self.indptr) < 0):
+            raise ValueError("indptr must not decrease")
+        if self.indices.size and int(self.indices.max()) >= self.numberOfNodes:
+            raise ValueError(f"edge to node {int(self.indices.max())} in a network of {self.numberOfNodes} nodes")
+
+    @property
+    def numberOfNodes(self):
+        return self.indptr.size - 1
+
+    @property
+    def numberOfEdges(self):
+        # Stored (directed) edges: an undirected contact counts twice.
+        return self.indices.size
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    def neighbours(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def neighbourPositions(self, nodes):
+        # Positions in indices of the neighbours of every node in nodes, in
+        # one vectorized gather (no loop over the nodes).
+        starts = self.indptr[nodes]
+        counts = self.indptr[np.asarray(nodes) + 1] - starts
+        skipped = np.cumsum(counts) - counts
+        return np.arange(counts.sum(), dtype=np.int64) + np.repeat(starts - skipped, counts)
+
+    @classmethod
+    def fromEdges(cls, sources, targets, numberOfNodes=None, directed=False, chunkEdges=DEFAULT_CHUNK_EDGES):
+        # Builds the network from arrays (or memory maps) of edge endpoints.
+        # Undirected edges are stored in both directions; in a directed
+        # network, source -> target means source can infect target. Self
+        # loops are dropped; repeated edges count as repeated contacts.
+        sources = np.asarray(sources)
+        targets = np.asarray(targets)
+        if sources.shape != targets.shape:
+            raise ValueError("sources and targets must have the same length")
+        if numberOfNodes is None:
+            numberOfNodes = 0
+            for first in range(0, sources.size, chunkEdges):
+                last = first + chunkEdges
+                numberOfNodes = max(numberOfNodes, int(sources[first:last].max()) + 1, int(targets[first:last].max()) + 1)
+
+        def chunks():
+            for first in range(0, sources.size, chunkEdges):
+                chunkSources = np.asarray(sources[first:first + chunkEdges], dtype=np.int64)
+                chunkTargets = np.asarray(targets[first:first + chunkEdges], dtype=np.int64)
+                if chunkSources.size and max(int(chunkSources.max()), int(chunkTargets.max())) >= numberOfNodes:
+                    raise ValueError(f"edge to a node beyond the {numberOfNodes} of the network")
+                if chunkSources.size and min(int(chunkSources.min()), int(chunkTargets.min())) < 0:
+                    raise ValueError("negative node in the edge list")
+                keep = chunkSources != chunkTargets
+                chunkSources, chunkTargets = chunkSources[keep], chunkTargets[keep]
+                yield chunkSources, chunkTargets
+                if not directed:
+                    yield chunkTargets, chunkSources
+
+        # Counting sort in two passes: degrees first, then every chunk's
+        # edges placed after the ones already written for their source.
+        degrees = np.zeros(numberOfNodes, dtype=np.int64)
+        for chunkSources, _ in chunks():
+            degrees += np.bincount(chunkSources, minlength=numberOfNodes)
+        indptr = np.zeros(numberOfNodes + 1, dtype=np.int64)
+        np.cumsum(degrees, out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.uint32)
+        cursor = indptr[:-1].copy()
+        for chunkSources, chunkTargets in chunks():
+            order = np.argsort(chunkSources, kind='stable')
+            chunkSources, chunkTargets = chunkSources[order], chunkTargets[order]
+            groupStarts = np.flatnonzero(np.r_[True, chunkSources[1:] != chunkSources[:-1]])
+            ranks = np.arange(chunkSources.size) - np.repeat(groupStarts, np.diff(np.r_[groupStarts, chunkSources.size]))
+            indices[cursor[chunkSources] + ranks] = chunkTargets
+            cursor += np.bincount(chunkSources, minlength=numberOfNodes)
+        return cls(indptr, indices)
+
+    @classmethod
+    def grid(cls, size):
+        # The square grid with Moore neighbourhoods of the other engines,
+        # node line * size + column for each cell.
+        cells = np.arange(size * size, dtype=np.int64).reshape(size, size)
+        sources, targets = [], []
+        for di, dj in ((0, 1), (1, -1), (1, 0), (1, 1)):
+            origin = cells[max(0, -di):size - max(0, di), max(0, -dj):size - max(0, dj)]
+            sources.append(origin.ravel())
+            targets.append((origin + di * size + dj).ravel())
+        return cls.fromEdges(np.concatenate(sources), np.concatenate(targets), size * size)
+
+    def save(self, path):
+        # Uncompressed .npz with the CSR arrays.
+        with open(path, 'wb') as file:
+            np.savez(file, indptr=self.indptr, indices=self.indices)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['indptr'], data['indices'])
+
+def writeEdgeList(path, sources, targets):
+    # Binary edge list: interleaved little-endian uint32 (source, target).
+    edges = np.empty((len(sources), 2), dtype='<u4')
+    edges[:, 0] = sources
+    edges[:, 1] = targets
+    edges.tofile(path)
+
+def readEdgeList(path, numberOfNodes=None, directed=False, chunkEdges=DEFAULT_CHUNK_EDGES):
+    # ContactNetwork from a binary edge list written by writeEdgeList.
+    edges = np.memmap(path, dtype='<u4', mode='r')
+    if edges.size % 2:
+        raise ValueError(f"{path} does not hold whole (source, target) pairs")
+    edges = edges.reshape(-1, 2)
+    return ContactNetwork.fromEdges(edges[:, 0], edges[:, 1], numberOfNodes, directed, chunkEdges)
+
+class NetworkRandomWalkModel(VectorizedRandomWalkModel):
+    # The vectorized engine on a ContactNetwork: population is a uint8 array
+    # with the state code of every node, and the transition matrix, state
+    # codes, scenarios and random modes are the same as on the grid.
+    #
+    # Infections take one sparse pass per generation: the edges of the sick
+    # nodes are gathered from the CSR arrays and counted per target, which
+    # gives every node's number of sick contacts (its infection pressure)
+    # at a cost proportional to the sick nodes' edges, not to the whole
+    # network. There is no sweep order on a network, so every node that is
+    # healthy in the next generation (including one that has just
+    # recovered) is exposed to all its sick contacts, and escapes with
+    # probability (1 - (1 - socialDistanceEffect) * contagionFactor) ** k.
+    # On ContactNetwork.grid(N), with synchronous=True and the grid's centre
+    # cell infected, this gives the grid of
+    # VectorizedRandomWalkModel(N, synchronous=True) for the same seed.
+    #
+    # initialInfected is the middle node by default (or CENTRE), a number
+    # of nodes picked at random from the seed, or a list of nodes.
+    def __init__(self, network, seed=None, initialInfected=None, debug=False, synchronous=False):
+        super().__init__(1, seed, debug, synchronous)
+        self.network = network
+        self.population = np.full(network.numberOfNodes, HEALTHY, dtype=np.uint8)
+        self.nextPopulation = self.population.copy()
+        self.initialInfected = initialInfected
+        self.reset(seed)
+
+    def startingCells(self, initialInfected, seed):
+        nodes = self.network.numberOfNodes
+        if initialInfected is None or isinstance(initialInfected, str) and initialInfected == CENTRE:
+            return [nodes // 2]
+        if isinstance(initialInfected, numbers.Integral):
+            return randomCells(nodes, int(initialInfected), seed)
+        initialInfected = np.asarray(initialInfected, dtype=np.int64)
+        if initialInfected.size and (initialInfected.min() < 0 or initialInfected.max() >= nodes):
+            raise ValueError(f"initial node outside a network of {nodes} nodes")
+        return initialInfected
+
+    def computeInfections(self, nextPopulation, population=None, top=0, offset=0):
+        population = self.population if population is None else population
+        sick = np.flatnonzero(population == SICK)
+        if sick.size == 0:
+            return 0
+        targets = self.network.indices[self.network.neighbourPositions(sick)]
+        contacts = targets.size
+        targets = targets[nextPopulation[targets] == HEALTHY]
+        if targets.size == 0:
+            return 0
+        if targets.size * 8 < nextPopulation.size:
+            exposed, exposures = np.unique(targets, return_counts=True)
+        else:
+            exposures = np.bincount(targets, minlength=nextPopulation.size)
+            exposed = np.flatnonzero(exposures)
+            exposures = exposures[exposed]
+
+        escape = np.array(escapeProbabilities(self.contagionFactor, self.socialDistanceEffect, int(exposures.max())))[exposures]
+        infected = exposed[self.uniforms(INFECTION, exposed) >= escape]
+        nextPopulation[infected] = SICK
+        if self.instrumentation is not None:
+            self.instrumentation.count('contactsAttempted', contacts)
+            self.instrumentation.count('infections', infected.size)
+        return infected.size
+
+    def loadPopulation(self, codes):
+        # Replaces the state of every node and restarts the counts and history.
+        codes = np.asarray(codes, dtype=np.uint8).reshape(self.population.shape)
+        if codes.max() >= len(State):
+            raise ValueError(f"invalid state code {codes.max()}")
+        self.population[...] = codes
+        np.copyto(self.nextPopulation, self.population)
+        self.transient = None
+        self.cases = self.countCases()
+        self.history = [self.report()]
+
+    def getState(self):
+        # The vectorized engine's state, with the number of nodes. The
+        # network itself is not saved: loadModel takes it as an argument.
+        state = super().getState()
+        state['engine'] = 'network'
+        state['nodes'] = self.network.numberOfNodes
+        return state
+
+    def image(self):
+        # The nodes in order, line by line, in the narrowest square that
+        # holds them (node line * N + column of ContactNetwork.grid(N) lands
+        # on its own cell); the pixels left over are black.
+        from .images import gridImage
+        nodes = self.population.size
+        columns = math.isqrt(max(nodes - 1, 0)) + 1
+        lines = max(1, -(-nodes // columns))
+        buffer = np.full(lines * columns, len(State), dtype=np.uint8)
+        buffer[:nodes] = self.population
+        return gridImage(buffer, columns, lines)
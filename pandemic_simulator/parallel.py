@@ -0,0 +1,186 @@
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .aggregate import RunningStatistics
+from .checkpoint import advance, loadModel, runCheckpointPath
+from .instrumentation import Instrumentation
+from .model import RandomWalkModel
+from .vectorized import VectorizedRandomWalkModel
+
+def runSeeds(numberOfRuns, seed=None):
+    # One independent stream per run, spawned from a single master seed, so
+    # run i always sees the same random numbers whoever executes it.
+    return np.random.SeedSequence(seed).spawn(numberOfRuns)
+
+def buildModel(populationMatrixSize, seedSequence, vectorized, scenario=None, synchronous=False, model=None):
+    # A model for the run of seedSequence. model, if given, is one built
+    # here for an earlier run with the same size, engine and mode: it is
+    # reset in place instead of building another. Both engines take the
+    # SeedSequence itself, so in synchronous mode they draw from the same
+    # counter key and give the same rows.
+    if model is not None:
+        model.reset(seedSequence)
+    elif vectorized:
+        model = VectorizedRandomWalkModel(populationMatrixSize, seedSequence, synchronous=synchronous)
+    else:
+        model = RandomWalkModel(populationMatrixSize, seedSequence, synchronous=synchronous)
+    if scenario is not None:
+        scenario.apply(model)
+    return model
+
+def runSimulation(populationMatrixSize, generations, seedSequence, vectorized=True, instrument=False, scenario=None, imagePath=None, verbose=False,
+                  checkpointPath=None, checkpointEvery=None, synchronous=False, model=None):
+    # Returns report() + [deaths], the per-generation history of the run and
+    # its instrumentation metrics (None unless instrument is set). Saves the
+    # final grid to imagePath, if given. With a checkpointPath, the run is
+    # saved there every checkpointEvery generations and continues from the
+    # saved state if there is one. synchronous selects the models'
+    # synchronous mode, with counter-based draws. model, if given, is a
+    # model already built or reset for this run by buildModel.
+    if checkpointPath is not None and os.path.exists(checkpointPath):
+        model = loadModel(checkpointPath)
+    elif model is None:
+        model = buildModel(populationMatrixSize, seedSequence, vectorized, scenario, synchronous)
+    model.instrumentation = Instrumentation() if instrument else None
+    if checkpointPath is None:
+        model.simulation(generations, verbose)
+    else:
+        advance(model, generations, checkpointPath, checkpointEvery, verbose)
+    if imagePath is not None:
+        model.image().save(imagePath)
+    metrics = model.instrumentation.metrics() if instrument else None
+    return model.report() + [model.numberOfDeaths()], model.history, metrics
+
+def runChunk(populationMatrixSize, generations, seedSequences, vectorized, instrument=False, scenario=None, imageDirectory=None, firstRun=1, verbose=False,
+             checkpointDirectory=None, checkpointEvery=None, synchronous=False):
+    # Images are named after the run number, like printImage(f"run_{run}").
+    # The runs of a chunk share one model, reset for every run; a run
+    # resumed from a checkpoint uses the model saved there instead.
+    results = []
+    model = None
+    for run, seedSequence in enumerate(seedSequences, firstRun):
+        imagePath = os.path.join(imageDirectory, f"simulation-run_{run}.png") if imageDirectory else None
+        checkpointPath = runCheckpointPath(checkpointDirectory, run) if checkpointDirectory else None
+        if checkpointPath is None or not os.path.exists(checkpointPath):
+            model = buildModel(populationMatrixSize, seedSequence, vectorized, scenario, synchronous, model)
+        results.append(runSimulation(
+            populationMatrixSize, generations, seedSequence, vectorized, instrument, scenario, imagePath, verbose,
+            checkpointPath, checkpointEvery, synchronous, model,
+        ))
+    return results
+
+def collectRuns(chunkResults, writer=None, instrumentation=None, checkpoint=None, rows=None):
+    # Gathers the final rows in run order (after the rows already finished,
+    # if any), streaming each run's history to the writer (numbered from 1,
+    # like the report tables) as it arrives, adding its metrics to
+    # instrumentation and recording it in the checkpoint.
+    rows = [] if rows is None else rows
+    for chunk in chunkResults:
+        for row, history, metrics in chunk:
+            rows.append(row)
+            if writer is not None:
+                writer.writeRun(len(rows), history)
+            if instrumentation is not None:
+                instrumentation.merge(metrics)
+            if checkpoint is not None:
+                checkpoint.complete(len(rows), row)
+    return rows
+
+def runChunks(executor, populationMatrixSize, generations, seeds, first, last, chunkSize, vectorized, options):
+    # Results of runs first + 1 .. last, chunk by chunk in run order: run
+    # here without an executor, otherwise all submitted at once.
+    starts = range(first, last, chunkSize)
+    chunks = [(seeds[start:min(start + chunkSize, last)], start + 1) for start in starts]
+    if executor is None:
+        return (
+            runChunk(populationMatrixSize, generations, chunk, vectorized, firstRun=firstRun, **options)
+            for chunk, firstRun in chunks
+        )
+    futures = deque(
+        executor.submit(runChunk, populationMatrixSize, generations, chunk, vectorized, firstRun=firstRun, **options)
+        for chunk, firstRun in chunks
+    )
+    return (futures.popleft().result() for _ in range(len(chunks)))
+
+def parallelRuns(numberOfRuns, populationMatrixSize, generations, seed=None, workers=None, chunkSize=None, vectorized=True, writer=None,
+                 instrumentation=None, scenario=None, imageDirectory=None, verbose=False, checkpoint=None):
+    # Spreads the runs over a process pool and returns report() + [deaths]
+    # for every run, in run order. Each run only depends on its own seed, so
+    # the rows are identical for any number of workers or chunk size.
+    # Runs are sent in chunks (by default about four per worker) so that
+    # pickling and scheduling stay small next to the simulations themselves.
+    # Pass an Instrumentation to collect the timers and counters of every
+    # run into it, a Scenario to set the model parameters, and an
+    # imageDirectory to save the final grid of every run.
+    # With a BatchCheckpoint, finished runs and the state of unfinished ones
+    # are saved as the batch goes, and a resumed batch skips the finished
+    # runs and continues the others from their last checkpoint.
+    instrument = instrumentation is not None
+    workers = workers or os.cpu_count() or 1
+    options = dict(instrument=instrument, scenario=scenario, imageDirectory=imageDirectory, verbose=verbose)
+    rows = []
+    if checkpoint is not None:
+        settings = {
+            'numberOfRuns': numberOfRuns,
+            'populationMatrixSize': populationMatrixSize,
+            'generations': generations,
+            'engine': 'vectorized' if vectorized else 'object',
+            'scenario': scenario.toDict() if scenario is not None else None,
+        }
+        rows, seed = checkpoint.start(settings, seed)
+        options.update(checkpointDirectory=checkpoint.directory, checkpointEvery=checkpoint.every)
+    seeds = runSeeds(numberOfRuns, seed)
+    chunkSize = chunkSize or max(1, math.ceil((numberOfRuns - len(rows)) / (workers * 4)))
+    if workers == 1:
+        chunkResults = runChunks(None, populationMatrixSize, generations, seeds, len(rows), numberOfRuns, chunkSize, vectorized, options)
+        return collectRuns(chunkResults, writer, instrumentation, checkpoint, rows)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunkResults = runChunks(executor, populationMatrixSize, generations, seeds, len(rows), numberOfRuns, chunkSize, vectorized, options)
+        return collectRuns(chunkResults, writer, instrumentation, checkpoint, rows)
+
+def halfWidth(statistics, z=1.96):
+    low, high = statistics.confidenceInterval(z)[0]
+    return (high - low) / 2
+
+def adaptiveRuns(populationMatrixSize, generations, tolerance, column=-1, relative=False, z=1.96, minimumRuns=30, maximumRuns=100000,
+                 roundSize=100, seed=None, workers=None, vectorized=True, writer=None, instrumentation=None, scenario=None):
+    # Runs rounds of roundSize runs until the confidence interval of the mean
+    # of `column` (of report() + [deaths], so deaths by default) has a
+    # half-width of at most tolerance (a fraction of the mean if relative),
+    # after at least minimumRuns and at most maximumRuns runs. Returns the
+    # rows like parallelRuns. Run i has the same seed as in parallelRuns,
+    # and the stopping rule is checked at round boundaries only, so a seed
+    # and roundSize always give the same rows whatever the number of workers.
+    instrument = instrumentation is not None
+    workers = workers or os.cpu_count() or 1
+    options = dict(instrument=instrument, scenario=scenario)
+    # Seeds are spawned round by round: spawning is incremental, so run i
+    # gets the same child as from runSeeds, without creating maximumRuns
+    # of them up front.
+    parent = np.random.SeedSequence(seed)
+    seeds = []
+    chunkSize = max(1, math.ceil(roundSize / (workers * 4)))
+    statistics = RunningStatistics(['metric'])
+    rows = []
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while len(rows) < maximumRuns:
+            first = len(rows)
+            last = min(first + roundSize, maximumRuns)
+            seeds.extend(parent.spawn(last - first))
+            chunkResults = runChunks(executor, populationMatrixSize, generations, seeds, first, last, chunkSize, vectorized, options)
+            collectRuns(chunkResults, writer, instrumentation, rows=rows)
+            for row in rows[first:]:
+                statistics.add([row[column]])
+            target = tolerance * abs(statistics.mean[0]) if relative else tolerance
+            if len(rows) >= minimumRuns and halfWidth(statistics, z) <= target:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return rows
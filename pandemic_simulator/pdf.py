@@ -0,0 +1,45 @@
+from fpdf import FPDF # Certifique-se de que a biblioteca está instalada (pip install fpdf2)
+
+# =======================
+#      PDF GENERATOR
+# =======================
+class PDF(FPDF):
+    def header(self):
+        self.set_font('Arial', 'B', 14)
+        self.cell(0, 10, 'Relatório Consolidado das Simulações', 0, 1, 'C')
+        self.ln(5)
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.cell(0, 10, f'Página {self.page_no()}', 0, 0, 'C')
+
+    def create_table(self, table_data, headers, summary_row=None):
+        self.set_font('Arial', 'B', 9)
+        # Distribui a largura da coluna de forma uniforme
+        effective_width = self.w - self.l_margin - self.r_margin
+        col_width = effective_width / len(headers)
+
+        # Imprime os cabeçalhos da tabela
+        for header in headers:
+            self.cell(col_width, 8, header, 1, 0, 'C')
+        self.ln()
+
+        # Imprime as linhas de dados da tabela
+        self.set_font('Arial', '', 9)
+        for row in table_data:
+            for item in row:
+                self.cell(col_width, 8, str(item), 1, 0, 'C')
+            self.ln()
+
+        # Imprime a linha de resumo (média) com destaque
+        if summary_row:
+            self.set_font('Arial', 'B', 9) # Usa negrito para a linha de resumo
+            for item in summary_row:
+                self.cell(col_width, 8, str(item), 1, 0, 'C')
+            self.ln()
+
+    def create_section(self, title):
+        self.set_font('Arial', 'B', 11)
+        self.cell(0, 8, title, 0, 1, 'L')
+        self.ln(2)
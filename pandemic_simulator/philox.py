@@ -0,0 +1,73 @@
+import numpy as np
+
+# Counter-based random numbers for the synchronous mode of the engines.
+# Every draw is Philox4x32-10 (Salmon et al., "Parallel random numbers: as
+# easy as 1, 2, 3", SC 2011) of a counter made of the cell's index in the
+# whole grid, the generation and the purpose of the draw, under a key taken
+# from the seed. A draw never depends on which draws came before it, so any
+# engine, worker or tile computing a cell gets the same number for it.
+
+TRANSITION = 0 # Draw that picks the next state of a cell on its own
+INFECTION = 1 # Draw that decides whether an exposed healthy cell gets sick
+PLACEMENT = 2 # Draws that pick the cells infected at the start of a run
+
+PHILOX_M0 = 0xD2511F53
+PHILOX_M1 = 0xCD9E8D57
+PHILOX_W0 = 0x9E3779B9
+PHILOX_W1 = 0xBB67AE85
+PHILOX_ROUNDS = 10
+MASK32 = 0xFFFFFFFF
+UNIT = 2.0 ** -53
+
+def philox(counter, key):
+    # Philox4x32-10 of four 32-bit counter words under two key words. Works
+    # on Python ints and, word by word, on uint64 arrays holding 32-bit values.
+    c0, c1, c2, c3 = counter
+    k0, k1 = key
+    for _ in range(PHILOX_ROUNDS):
+        product0 = c0 * PHILOX_M0
+        product1 = c2 * PHILOX_M1
+        c0, c1, c2, c3 = (product1 >> 32) ^ c1 ^ k0, product1 & MASK32, (product0 >> 32) ^ c3 ^ k1, product0 & MASK32
+        k0 = (k0 + PHILOX_W0) & MASK32
+        k1 = (k1 + PHILOX_W1) & MASK32
+    return c0, c1, c2, c3
+
+def escapeProbabilities(contagionFactor, socialDistanceEffect, maximumExposures=8):
+    # Probability that a cell exposed to k sick neighbours (k = 0 .. 8, or
+    # up to maximumExposures on a contact network) escapes infection, each
+    # contact infecting it with probability
+    # (1 - socialDistanceEffect) * contagionFactor. Every engine looks the
+    # values up in this one table, so they compare draws to the same floats.
+    contagion = (1 - socialDistanceEffect) * contagionFactor
+    return [(1 - contagion) ** exposures for exposures in range(maximumExposures + 1)]
+
+class CounterRandom:
+    # Uniform draws in [0, 1) keyed by (generation, purpose, cell), with 53
+    # random bits taken from the first two output words, as
+    # random.random() does. uniform() and uniforms() give the same floats.
+    def __init__(self, seed=None):
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.key = [int(word) for word in seed.generate_state(2, np.uint32)]
+
+    def uniform(self, generation, purpose, cell):
+        x0, x1, _, _ = philox((cell & MASK32, cell >> 32, generation & MASK32, purpose), self.key)
+        return ((x0 >> 5) << 26 | x1 >> 6) * UNIT
+
+    def uniforms(self, generation, purpose, cells):
+        cells = np.asarray(cells, dtype=np.uint64)
+        counter = (
+            cells & np.uint64(MASK32),
+            cells >> np.uint64(32),
+            np.full(cells.shape, generation & MASK32, dtype=np.uint64),
+            np.full(cells.shape, purpose, dtype=np.uint64),
+        )
+        key = tuple(np.uint64(word) for word in self.key)
+        x0, x1, _, _ = philox(counter, key)
+        return ((x0 >> np.uint64(5)) << np.uint64(26) | x1 >> np.uint64(6)).astype(np.float64) * UNIT
+
+    @classmethod
+    def fromKey(cls, key):
+        random = cls.__new__(cls)
+        random.key = [int(word) for word in key]
+        return random
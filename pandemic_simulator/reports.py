@@ -0,0 +1,66 @@
+PERCENTILES = (5, 50, 95)
+
+# Report files built from a RunningStatistics: a summary table (mean,
+# spread, 95% CI, min/max and percentiles per column) followed by the
+# per-run table of the runs it sampled and the rounded mean as the last
+# row, like the original consolidated reports. The exporter libraries are
+# only imported when the matching report is written.
+
+def summaryRows(statistics, percentiles=PERCENTILES):
+    rows = [
+        ['Média'] + [round(value, 2) for value in statistics.mean],
+        ['Desvio padrão'] + [round(value, 2) for value in statistics.standardDeviation()],
+        ['IC 95% inferior'] + [round(low, 2) for low, high in statistics.confidenceInterval()],
+        ['IC 95% superior'] + [round(high, 2) for low, high in statistics.confidenceInterval()],
+        ['Mínimo'] + statistics.minimum,
+        ['Máximo'] + statistics.maximum,
+    ]
+    for q in percentiles:
+        rows.append([f'P{q}'] + statistics.percentile(q))
+    return rows
+
+def averagesRow(statistics):
+    return ['Média Final'] + [round(value) for value in statistics.mean]
+
+def runRows(statistics):
+    return [[f"{run}"] + row for run, row in statistics.sampledRuns()]
+
+def writePdfReport(path, statistics, percentiles=PERCENTILES):
+    from .pdf import PDF
+
+    pdf = PDF()
+    pdf.add_page()
+    pdf.create_section(f'Resumo de {statistics.count} execuções')
+    pdf.create_table(
+        table_data=summaryRows(statistics, percentiles),
+        headers=['Estatística'] + statistics.columns,
+    )
+
+    runs = runRows(statistics)
+    if runs:
+        pdf.ln(5)
+        title = 'Execuções' if len(runs) == statistics.count else f'Amostra de {len(runs)} execuções'
+        pdf.create_section(title)
+        pdf.create_table(
+            table_data=runs,
+            headers=['Execução'] + statistics.columns,
+            summary_row=averagesRow(statistics),
+        )
+    pdf.output(path)
+
+def writeExcelReport(path, statistics, percentiles=PERCENTILES):
+    # Written with openpyxl's write-only mode, which streams rows to disk.
+    from openpyxl import Workbook # Certifique-se de que a biblioteca está instalada (pip install openpyxl)
+
+    workbook = Workbook(write_only=True)
+    results = workbook.create_sheet('Resultados Consolidados')
+    results.append(['Execução'] + statistics.columns)
+    for row in runRows(statistics):
+        results.append(row)
+    results.append(averagesRow(statistics))
+
+    summary = workbook.create_sheet('Resumo')
+    summary.append(['Estatística'] + statistics.columns)
+    for row in summaryRows(statistics, percentiles):
+        summary.append(row)
+    workbook.save(path)
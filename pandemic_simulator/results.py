@@ -0,0 +1,129 @@
+import csv
+import glob
+import os
+
+import numpy as np
+
+from .model import State
+
+COLUMNS = ['run', 'generation'] + [state.name for state in State]
+
+# Sinks that append the per-generation state counts of each run (its model's
+# history) to disk as soon as the run finishes. Nothing is kept in memory
+# beyond the current chunk, and whatever is already on disk can be read while
+# the batch is still running.
+
+def trimPartialLine(path, blockSize=65536):
+    # Cuts a file back to the end of its last complete line (a line cut
+    # short by a crash), reading only its tail.
+    with open(path, 'rb+') as file:
+        end = file.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - blockSize)
+            file.seek(start)
+            newline = file.read(position - start).rfind(b'\n')
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            file.truncate(position)
+
+class CsvTimeSeriesWriter:
+    # One row per (run, generation), flushed after every run. Appends to an
+    # existing file, so an interrupted batch can keep writing to it, after
+    # dropping a last line cut short by the interruption.
+    def __init__(self, path):
+        if os.path.exists(path):
+            trimPartialLine(path)
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, 'a', newline='')
+        self.writer = csv.writer(self.file)
+        if not exists:
+            self.writer.writerow(COLUMNS)
+
+    def writeRun(self, run, history):
+        self.writer.writerows([run, generation] + list(report) for generation, report in enumerate(history))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ChunkedTimeSeriesWriter:
+    # Buffers runsPerChunk runs and writes them as one file in a directory:
+    # chunk-000000.npz, chunk-000001.npz, ... (or .parquet, which needs
+    # pyarrow: pip install pyarrow). Each chunk is written to a temporary
+    # name and renamed, so readers only ever see complete chunks.
+    def __init__(self, directory, runsPerChunk=100, format='npz'):
+        if format not in ('npz', 'parquet'):
+            raise ValueError(f"unknown time-series format: {format}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.runsPerChunk = runsPerChunk
+        self.format = format
+        self.rows = []
+        self.runs = 0
+        self.chunk = len(glob.glob(os.path.join(directory, f'chunk-*.{format}')))
+
+    def writeRun(self, run, history):
+        self.rows.extend([run, generation] + list(report) for generation, report in enumerate(history))
+        self.runs += 1
+        if self.runs == self.runsPerChunk:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        rows = np.array(self.rows, dtype=np.int64)
+        path = os.path.join(self.directory, f'chunk-{self.chunk:06d}.{self.format}')
+        temporary = path + '.tmp'
+        if self.format == 'npz':
+            with open(temporary, 'wb') as file:
+                np.savez(file, **{column: rows[:, index] for index, column in enumerate(COLUMNS)})
+        else:
+            import pyarrow
+            import pyarrow.parquet
+            table = pyarrow.table({column: rows[:, index] for index, column in enumerate(COLUMNS)})
+            pyarrow.parquet.write_table(table, temporary)
+        os.replace(temporary, path)
+        self.chunk += 1
+        self.rows = []
+        self.runs = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def openTimeSeriesWriter(path, format='csv', runsPerChunk=100):
+    if format == 'csv':
+        return CsvTimeSeriesWriter(path)
+    return ChunkedTimeSeriesWriter(path, runsPerChunk, format)
+
+def readTimeSeries(path):
+    # Reads what has been written so far, from a CSV file or a directory of
+    # .npz chunks, as an array with one row per (run, generation) and the
+    # columns of COLUMNS. A CSV line cut short (one being written, or cut by
+    # a crash) has no line end yet and is skipped.
+    if os.path.isdir(path):
+        chunks = []
+        for chunk in sorted(glob.glob(os.path.join(path, 'chunk-*.npz'))):
+            with np.load(chunk) as data:
+                chunks.append(np.column_stack([data[column] for column in COLUMNS]))
+        return np.concatenate(chunks) if chunks else np.empty((0, len(COLUMNS)), dtype=np.int64)
+
+    with open(path, newline='') as file:
+        lines = [line for line in file if line.endswith('\n')]
+    rows = [row for row in csv.reader(lines) if len(row) == len(COLUMNS)][1:]
+    return np.array(rows, dtype=np.int64).reshape(-1, len(COLUMNS))
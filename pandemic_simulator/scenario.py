@@ -0,0 +1,64 @@
+import json
+import os
+
+from .model import CONTAGION_FACTOR, SOCIAL_DISTANCE_EFFECT, TRANSITION_PROBABILITIES, State
+from .transitions import TransitionTable
+
+# Scenario files shipped with the package, one JSON file per scenario.
+SCENARIO_DIRECTORY = os.path.join(os.path.dirname(__file__), 'scenarios')
+
+SCENARIO_KEYS = ('name', 'description', 'transitionProbabilities', 'contagionFactor', 'socialDistanceEffect', 'gridSize', 'generations')
+
+class Scenario:
+    # One simulation setup: the transition matrix (rows and columns in State
+    # order), the contact parameters, and the grid size and number of
+    # generations used when a run does not set its own. Scenario files are
+    # JSON objects with these keys.
+    def __init__(self, name, transitionProbabilities=TRANSITION_PROBABILITIES, contagionFactor=CONTAGION_FACTOR,
+                 socialDistanceEffect=SOCIAL_DISTANCE_EFFECT, gridSize=156, generations=52, description=''):
+        TransitionTable(transitionProbabilities, len(State)) # Fails early on a bad matrix
+        for parameter, value in (('contagionFactor', contagionFactor), ('socialDistanceEffect', socialDistanceEffect)):
+            if not 0 <= value <= 1:
+                raise ValueError(f"{parameter} must be between 0 and 1, got {value}")
+        self.name = name
+        self.description = description
+        self.transitionProbabilities = [list(row) for row in transitionProbabilities]
+        self.contagionFactor = contagionFactor
+        self.socialDistanceEffect = socialDistanceEffect
+        self.gridSize = gridSize
+        self.generations = generations
+
+    def apply(self, model):
+        # Works for every engine, they share these attributes.
+        model.transitionProbabilities = self.transitionProbabilities
+        model.contagionFactor = self.contagionFactor
+        model.socialDistanceEffect = self.socialDistanceEffect
+        return model
+
+    def toDict(self):
+        return {key: getattr(self, key) for key in SCENARIO_KEYS}
+
+    @classmethod
+    def fromDict(cls, data):
+        unknown = set(data) - set(SCENARIO_KEYS)
+        if unknown:
+            raise ValueError(f"unknown scenario keys: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.toDict(), file, indent=2)
+
+def availableScenarios():
+    return sorted(name[:-5] for name in os.listdir(SCENARIO_DIRECTORY) if name.endswith('.json'))
+
+def loadScenario(scenario):
+    # Takes the name of a shipped scenario ("default", "lockdown") or the
+    # path of a scenario file.
+    path = scenario if scenario.endswith('.json') or os.sep in scenario else os.path.join(SCENARIO_DIRECTORY, f'{scenario}.json')
+    if not os.path.exists(path):
+        raise ValueError(f"unknown scenario {scenario!r}, expected a .json file or one of: {', '.join(availableScenarios())}")
+    with open(path) as file:
+        data = json.load(file)
+    data.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    return Scenario.fromDict(data)
@@ -0,0 +1,350 @@
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from .aggregate import RunningStatistics
+from .cli import HEADERS
+from .instrumentation import Instrumentation
+from .parallel import buildModel, runSeeds
+from .scenario import Scenario, loadScenario
+from .sweep import ResultCache, pointParameters
+
+# Local job server, so that everyone running the same scenarios shares one
+# warm process pool and one set of results. Start it with
+#
+#     python -m pandemic_simulator.server --port 8765 --workers 0
+#
+# and submit jobs with submitJob() (or any client that speaks the protocol).
+# A connection sends one JSON line, a job such as
+#
+#     {"scenario": "lockdown", "numberOfRuns": 100, "seed": 0, "engine": "object"}
+#
+# or {"command": "status"}, and receives JSON lines until the job is done:
+# "accepted" (with the runs finished so far), "generation" for every
+# generation of every run (unless "progress" is false), "run" with the
+# running means and confidence intervals as each run finishes, and "done"
+# with the rows of every run in run order. Errors end with an "error" line.
+#
+# Jobs are identified by a hash of everything their rows depend on, so a
+# job identical to one queued, running or recently finished is not run
+# again: the client follows the existing job instead. Jobs run one after
+# the other in arrival order, each spread over the whole pool.
+
+DEFAULT_PORT = 8765
+JOB_KEYS = ('scenario', 'numberOfRuns', 'gridSize', 'generations', 'seed', 'engine', 'progress')
+
+progressQueue = None # Set in every worker of the pool by startWorker
+warmModels = {} # Model of the last run of every grid size and engine in this worker, reset for the next one
+
+def startWorker(queue):
+    global progressQueue
+    progressQueue = queue
+
+def runJobRun(key, run, populationMatrixSize, generations, seedSequence, vectorized, scenario):
+    # One run of a job in a pool worker, reporting every generation to the
+    # server through the progress queue. Returns report() + [deaths], like
+    # the other runners, so the rows match parallelRuns for the same seed.
+    settings = (populationMatrixSize, vectorized)
+    model = warmModels[settings] = buildModel(populationMatrixSize, seedSequence, vectorized, scenario, model=warmModels.get(settings))
+    model.instrumentation = Instrumentation(timers=False, observers=[
+        lambda model: progressQueue.put((key, run, model.currentGeneration, model.report())),
+    ])
+    model.simulation(generations)
+    return model.report() + [model.numberOfDeaths()]
+
+def integer(value, minimum):
+    # JSON integers only: bool is an int in Python, but not a count.
+    return isinstance(value, int) and not isinstance(value, bool) and value >= minimum
+
+class Job:
+    # A job's settings, its finished rows by run number, running statistics
+    # and the queues of the connections following it.
+    def __init__(self, key, scenario, numberOfRuns, seed, vectorized):
+        self.key = key
+        self.scenario = scenario
+        self.numberOfRuns = numberOfRuns
+        self.seed = seed
+        self.vectorized = vectorized
+        self.state = 'queued'
+        self.rows = {}
+        self.statistics = RunningStatistics(HEADERS)
+        self.subscribers = set()
+        self.error = None
+
+    def publish(self, message):
+        message['job'] = self.key
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(message)
+
+    def summary(self):
+        return {
+            'state': self.state,
+            'finished': self.statistics.count,
+            'numberOfRuns': self.numberOfRuns,
+            'mean': self.statistics.mean,
+            'confidenceInterval': self.statistics.confidenceInterval(),
+        }
+
+    def addRow(self, run, row):
+        self.rows[run] = row
+        self.statistics.add(row, run)
+        self.publish(dict(event='run', run=run, row=row, **self.summary()))
+
+    def result(self):
+        return dict(event='done', rows=[self.rows[run] for run in range(1, self.numberOfRuns + 1)], **self.summary())
+
+class SimulationServer:
+    # Listens on host:port (or on the Unix socket at path) and runs the jobs
+    # on a pool of `workers` processes started once, with the server. With
+    # a ResultCache, finished runs are also kept on disk, shared with
+    # sweep() and reused across restarts. The last keepJobs finished jobs
+    # stay in memory to answer repeated requests at once.
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, path=None, workers=None, cache=None, keepJobs=100):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache
+        self.keepJobs = keepJobs
+        self.jobs = OrderedDict() # Every queued, running or kept job by key, finished ones oldest first
+        self.server = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.progress = multiprocessing.Queue()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=startWorker, initargs=(self.progress,))
+        for future in [self.executor.submit(os.getpid) for _ in range(self.workers)]:
+            await asyncio.wrap_future(future) # Start every worker now rather than with the first job
+        self.reader = threading.Thread(target=self.readProgress, daemon=True)
+        self.reader.start()
+        self.dispatcher = asyncio.create_task(self.dispatch())
+        if self.path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, self.path)
+        else:
+            self.server = await asyncio.start_server(self.handle, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1] # The one picked by the system for port 0
+
+    async def serveForever(self):
+        await self.start()
+        with contextlib.suppress(NotImplementedError): # No signal handlers on Windows event loops
+            self.loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass # Stopped by SIGTERM
+        finally:
+            await self.close()
+
+    async def close(self):
+        self.server.close()
+        self.dispatcher.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.dispatcher
+        self.executor.shutdown(cancel_futures=True)
+        self.progress.put(None)
+        self.reader.join()
+        if self.path is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.path)
+
+    def readProgress(self):
+        # Forwards the generation reports of the workers to the event loop.
+        while True:
+            item = self.progress.get()
+            if item is None:
+                break
+            self.loop.call_soon_threadsafe(self.publishProgress, *item)
+
+    def publishProgress(self, key, run, generation, counts):
+        job = self.jobs.get(key)
+        if job is not None and job.state == 'running':
+            job.publish({'event': 'generation', 'run': run, 'generation': generation, 'counts': counts})
+
+    def submit(self, request):
+        # The job for a request: an existing one with the same key, or a new
+        # one at the end of the queue.
+        unknown = set(request) - set(JOB_KEYS)
+        if unknown:
+            raise ValueError(f"unknown job keys: {', '.join(sorted(unknown))}")
+        scenario = request.get('scenario', 'lockdown')
+        if isinstance(scenario, dict):
+            scenario = Scenario.fromDict(dict({'name': 'custom'}, **scenario))
+        elif isinstance(scenario, str):
+            scenario = loadScenario(scenario)
+        else:
+            raise ValueError(f"scenario must be a name or a scenario object, not {scenario!r}")
+        data = scenario.toDict()
+        for name in ('gridSize', 'generations'):
+            value = request.get(name)
+            if value is not None and not integer(value, 1):
+                raise ValueError(f"{name} must be a positive integer, not {value!r}")
+            data[name] = value or data[name]
+        scenario = Scenario.fromDict(data)
+        numberOfRuns = request.get('numberOfRuns', 100)
+        if not integer(numberOfRuns, 1):
+            raise ValueError(f"numberOfRuns must be a positive integer, not {numberOfRuns!r}")
+        engine = request.get('engine', 'object')
+        if engine not in ('object', 'vectorized'):
+            raise ValueError(f"engine must be 'object' or 'vectorized', not {engine!r}")
+        seed = request.get('seed', 0)
+        if not integer(seed, 0):
+            raise ValueError(f"seed must be a non-negative integer, not {seed!r}")
+
+        parameters = pointParameters(scenario, seed, engine == 'vectorized')
+        key = hashlib.sha256(json.dumps(dict(parameters, numberOfRuns=numberOfRuns), sort_keys=True).encode()).hexdigest()[:16]
+        job = self.jobs.get(key)
+        if job is None or job.state == 'failed':
+            job = Job(key, scenario, numberOfRuns, seed, engine == 'vectorized')
+            self.jobs[key] = job
+            self.queue.put_nowait(job)
+        return job
+
+    async def dispatch(self):
+        while True:
+            job = await self.queue.get()
+            await self.runJob(job)
+
+    async def runJob(self, job):
+        job.state = 'running'
+        job.publish({'event': 'started'})
+        parameters = pointParameters(job.scenario, job.seed, job.vectorized)
+        cached = self.cache.get(parameters) if self.cache is not None else []
+        for run, row in enumerate(cached[:job.numberOfRuns], 1):
+            job.addRow(run, row)
+        seeds = runSeeds(job.numberOfRuns, job.seed)
+
+        async def runOne(run):
+            future = self.executor.submit(
+                runJobRun, job.key, run, job.scenario.gridSize, job.scenario.generations, seeds[run - 1], job.vectorized, job.scenario,
+            )
+            job.addRow(run, await asyncio.wrap_future(future))
+
+        try:
+            await asyncio.gather(*(runOne(run) for run in range(len(job.rows) + 1, job.numberOfRuns + 1)))
+        except Exception as error:
+            job.state = 'failed'
+            job.error = f"{type(error).__name__}: {error}"
+            job.publish({'event': 'error', 'message': job.error})
+            return
+        job.state = 'done'
+        result = job.result()
+        if self.cache is not None and len(result['rows']) > len(cached):
+            self.cache.put(parameters, result['rows'])
+        job.publish(result)
+
+        self.jobs.move_to_end(job.key)
+        finished = [key for key, kept in self.jobs.items() if kept.state in ('done', 'failed')]
+        for key in finished[:max(0, len(finished) - self.keepJobs)]:
+            del self.jobs[key]
+
+    def status(self):
+        return {
+            'event': 'status',
+            'workers': self.workers,
+            'queued': self.queue.qsize(),
+            'jobs': [dict(job=job.key, scenario=job.scenario.name, **job.summary()) for job in self.jobs.values()],
+        }
+
+    async def handle(self, reader, writer):
+        async def send(message):
+            writer.write(json.dumps(message).encode() + b'\n')
+            await writer.drain()
+
+        subscriber = asyncio.Queue()
+        job = None
+        try:
+            request = json.loads(await reader.readline())
+            if not isinstance(request, dict):
+                raise ValueError("a request is a JSON object")
+            if request.get('command') == 'status':
+                await send(self.status())
+                return
+            progress = request.get('progress', True)
+            job = self.submit(request)
+            job.subscribers.add(subscriber)
+            await send(dict(event='accepted', job=job.key, **job.summary()))
+            if job.state == 'done':
+                await send(dict(job.result(), job=job.key))
+                return
+            while True:
+                message = await subscriber.get()
+                if message['event'] == 'generation' and not progress:
+                    continue
+                await send(message)
+                if message['event'] in ('done', 'error'):
+                    break
+        except (ValueError, TypeError) as error:
+            with contextlib.suppress(ConnectionError):
+                await send({'event': 'error', 'message': str(error)})
+        except ConnectionError:
+            pass # The client went away; the job goes on for the others
+        finally:
+            if job is not None:
+                job.subscribers.discard(subscriber)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+def connect(host, port, path):
+    if path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path)
+        return connection
+    return socket.create_connection((host, port))
+
+def submitJob(job, host='127.0.0.1', port=DEFAULT_PORT, path=None, onEvent=None):
+    # Sends a job (a dict with the JOB_KEYS above) and blocks until it is
+    # done, calling onEvent(message) for every line the server sends.
+    # Returns the "done" message, whose "rows" are the rows of every run.
+    # Blocking on a plain socket keeps it usable from notebooks, which
+    # already run an event loop of their own.
+    with connect(host, port, path) as connection, connection.makefile('rw', encoding='utf-8') as stream:
+        stream.write(json.dumps(job) + '\n')
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if onEvent is not None:
+                onEvent(message)
+            if message['event'] == 'error':
+                raise ValueError(message['message'])
+            if message['event'] == 'done':
+                return message
+    raise ConnectionError("the server closed the connection before the job was done")
+
+def serverStatus(host='127.0.0.1', port=DEFAULT_PORT, path=None):
+    with connect(host, port, path) as connection, connection.makefile('rw', encoding='utf-8') as stream:
+        stream.write(json.dumps({'command': 'status'}) + '\n')
+        stream.flush()
+        return json.loads(stream.readline())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pandemic_simulator.server', description='Serve simulation jobs on localhost.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--socket', help='listen on this Unix socket instead of host:port')
+    parser.add_argument('--workers', type=int, default=0, help='worker processes (0 for one per CPU)')
+    parser.add_argument('--cache', help='keep finished runs in this directory (shared with the sweeps)')
+    parser.add_argument('--cache-size', type=float, default=256, help='cache size limit in MB')
+    parser.add_argument('--keep-jobs', type=int, default=100, help='finished jobs kept in memory')
+    args = parser.parse_args(argv)
+
+    cache = ResultCache(args.cache, int(args.cache_size * 2**20)) if args.cache else None
+    server = SimulationServer(args.host, args.port, args.socket, args.workers or None, cache, args.keep_jobs)
+    print(f"Servidor em {args.socket or f'{args.host}:{args.port}'} com {server.workers} processos")
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(server.serveForever())
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import argparse
+import contextlib
+import csv
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from .aggregate import RunningStatistics
+from .cli import HEADERS
+from .parallel import collectRuns, runChunks, runSeeds
+from .scenario import SCENARIO_KEYS, Scenario, loadScenario
+
+# Parameter sweeps with their results cached on disk. Run with
+#
+#     python -m pandemic_simulator.sweep default lockdown --contagion 0.5 0.7 --distance 0 0.25 0.5 --runs 200
+#
+# Every point of a sweep is a Scenario. Its rows are cached under a hash of
+# everything they depend on, so repeating a sweep, adding points to it or
+# asking for more runs per point only computes what is not cached yet.
+
+CACHE_VERSION = 1 # Bump when a change to the engines changes the rows of a seed
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+def pointParameters(scenario, seed, vectorized):
+    # Everything the rows of a point depend on. The number of runs is not
+    # part of it: run i has the same seed however many runs are asked for.
+    return {
+        'version': CACHE_VERSION,
+        'engine': 'vectorized' if vectorized else 'object',
+        'seed': seed,
+        'transitionProbabilities': scenario.transitionProbabilities,
+        'contagionFactor': scenario.contagionFactor,
+        'socialDistanceEffect': scenario.socialDistanceEffect,
+        'gridSize': scenario.gridSize,
+        'generations': scenario.generations,
+    }
+
+class ResultCache:
+    # Rows of finished runs, one JSON file per sweep point named after the
+    # SHA-256 of its pointParameters(). Files are written to a temporary
+    # name and renamed, and touched when read; once the files add up to more
+    # than maxBytes the least recently used ones are removed.
+    def __init__(self, directory, maxBytes=DEFAULT_CACHE_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    def path(self, parameters):
+        key = hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, parameters):
+        path = self.path(parameters)
+        try:
+            with open(path) as file:
+                entry = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return []
+        if entry['parameters'] != json.loads(json.dumps(parameters)):
+            return []
+        os.utime(path)
+        return entry['rows']
+
+    def put(self, parameters, rows):
+        path = self.path(parameters)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'parameters': parameters, 'rows': rows}, file)
+        os.replace(temporary, path)
+        self.evict()
+
+    def entries(self):
+        # (last use, size, path) of every cached point, oldest first.
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                status = os.stat(os.path.join(self.directory, name))
+                entries.append((status.st_mtime, status.st_size, os.path.join(self.directory, name)))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.maxBytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+
+def parameterGrid(scenarios, **values):
+    # Every combination of the given values for each base scenario, as
+    # Scenarios named after the values they change, e.g.
+    # parameterGrid([lockdown], contagionFactor=[0.5, 0.7], socialDistanceEffect=[0.0, 0.5]).
+    # Any scenario key can be swept, transition matrices included.
+    unknown = set(values) - (set(SCENARIO_KEYS) - {'name', 'description'})
+    if unknown:
+        raise ValueError(f"cannot sweep over {', '.join(sorted(unknown))}")
+    points = []
+    for scenario in scenarios:
+        for combination in itertools.product(*values.values()):
+            data = scenario.toDict()
+            data.update(zip(values, combination))
+            data['name'] = scenario.name + ''.join(
+                f' {key}={value}' for key, value in zip(values, combination) if key != 'transitionProbabilities'
+            )
+            points.append(Scenario.fromDict(data))
+    return points
+
+def sweep(points, numberOfRuns, seed=0, workers=None, vectorized=True, cache=None, chunkSize=None):
+    # Runs numberOfRuns runs of every point (a Scenario, with its own grid
+    # size and generations) and returns (point, rows) pairs, the rows being
+    # report() + [deaths] as in parallelRuns. Runs already in the cache are
+    # not computed again; the others are all scheduled at once on one
+    # process pool, so small points run next to large ones.
+    workers = workers or os.cpu_count() or 1
+    seeds = runSeeds(numberOfRuns, seed)
+    chunkSize = chunkSize or max(1, math.ceil(numberOfRuns / (workers * 4)))
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else contextlib.nullcontext() as executor:
+        pending = []
+        for point in points:
+            parameters = pointParameters(point, seed, vectorized)
+            cached = cache.get(parameters) if cache is not None else []
+            rows = cached[:numberOfRuns]
+            chunkResults = runChunks(
+                executor, point.gridSize, point.generations, seeds, len(rows), numberOfRuns, chunkSize, vectorized, {'scenario': point},
+            )
+            pending.append((point, parameters, cached, rows, chunkResults))
+        for point, parameters, cached, rows, chunkResults in pending:
+            collectRuns(chunkResults, rows=rows)
+            if cache is not None and len(rows) > len(cached):
+                cache.put(parameters, rows)
+            results.append((point, rows))
+    return results
+
+def summaryTable(results, column=-1, z=1.96):
+    # One row per point: its name, number of runs, the mean of every column
+    # and the confidence interval of `column` (deaths by default).
+    table = []
+    for point, rows in results:
+        statistics = RunningStatistics(HEADERS)
+        statistics.addAll(rows)
+        low, high = statistics.confidenceInterval(z)[column]
+        table.append([point.name, statistics.count] + [round(mean, 2) for mean in statistics.mean] + [round(low, 2), round(high, 2)])
+    return table
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pandemic_simulator.sweep', description='Sweep scenario parameters, caching the results.')
+    parser.add_argument('scenarios', nargs='*', default=['lockdown'], help='base scenarios (names or .json files), one transition matrix each')
+    parser.add_argument('--contagion', type=float, nargs='+', help='contagionFactor values')
+    parser.add_argument('--distance', type=float, nargs='+', help='socialDistanceEffect values')
+    parser.add_argument('--grid-size', type=int, nargs='+', help='grid sizes')
+    parser.add_argument('--generations', type=int, nargs='+', help='generations per run')
+    parser.add_argument('--runs', type=int, default=100, help='runs per point')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engine', choices=['object', 'vectorized'], default='vectorized')
+    parser.add_argument('--workers', type=int, default=0, help='worker processes (0 for one per CPU)')
+    parser.add_argument('--cache', default='.sweep-cache', help='cache directory')
+    parser.add_argument('--cache-size', type=float, default=DEFAULT_CACHE_BYTES / 2**20, help='cache size limit in MB')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--output', help='write the summary table to this CSV file')
+    args = parser.parse_args(argv)
+
+    values = {}
+    for key, value in (('contagionFactor', args.contagion), ('socialDistanceEffect', args.distance),
+                       ('gridSize', args.grid_size), ('generations', args.generations)):
+        if value:
+            values[key] = value
+    try:
+        points = parameterGrid([loadScenario(scenario) for scenario in args.scenarios], **values)
+    except ValueError as error:
+        parser.error(str(error))
+    cache = None if args.no_cache else ResultCache(args.cache, int(args.cache_size * 2**20))
+    results = sweep(points, args.runs, args.seed, args.workers or None, args.engine == 'vectorized', cache)
+
+    headers = ['Scenario', 'Runs'] + HEADERS + ['Deaths CI low', 'Deaths CI high']
+    table = summaryTable(results)
+    if args.output:
+        with open(args.output, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(headers)
+            writer.writerows(table)
+    from tabulate import tabulate
+    print(tabulate(table, headers=headers, tablefmt="grid"))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from .model import DEAD, HEALTHY, SICK, State, initialCells
+from .philox import TRANSITION, CounterRandom
+from .vectorized import VectorizedRandomWalkModel
+
+# Working memory per cell of a stripe: the stripe and its next state, the
+# masks and neighbour counts, and the indices and draws of its active cells.
+BYTES_PER_CELL = 32
+DEFAULT_TILE_BUDGET = 64 * 1024 * 1024
+
+class TiledRandomWalkModel(VectorizedRandomWalkModel):
+    # The vectorized engine for grids larger than memory. The two state
+    # buffers are raw files of N * N bytes in `directory` (a temporary one
+    # by default, removed by close()), and each generation goes through the
+    # grid in stripes of whole lines: read the stripe with one halo line
+    # above and below (every interaction stays within the 3x3 Moore
+    # neighbourhood, so that is all it needs), step it in memory and write
+    # it to the other buffer. Reads and writes are single sequential
+    # transfers per stripe, and memory stays around tileBudget bytes
+    # whatever the grid size.
+    #
+    # The random numbers are drawn stripe by stripe, so a seed gives the
+    # same run for the same tileBudget; the results follow the same
+    # distribution as VectorizedRandomWalkModel for any budget. In
+    # synchronous mode, the draws are keyed by cell and any budget gives the
+    # grid of VectorizedRandomWalkModel(synchronous=True).
+    def __init__(self, populationMatrixSize, directory=None, seed=None, tileBudget=DEFAULT_TILE_BUDGET, debug=False, synchronous=False,
+                 initialInfected=None):
+        self.initModel(seed, debug, synchronous, initialInfected)
+        self.size = populationMatrixSize
+        self.stripeLines = max(1, min(populationMatrixSize, tileBudget // (populationMatrixSize * BYTES_PER_CELL)))
+        self.rng = np.random.default_rng(seed)
+        self.transient = None # Per stripe, indices of the cells that can still change, once infection-free
+
+        self.temporary = directory is None
+        self.directory = tempfile.mkdtemp(prefix='pandemic-') if directory is None else directory
+        os.makedirs(self.directory, exist_ok=True)
+        self.paths = [os.path.join(self.directory, f'grid-{buffer}.u8') for buffer in 'ab']
+        self.files = []
+        for path in self.paths:
+            file = open(path, 'w+b')
+            file.truncate(populationMatrixSize * populationMatrixSize) # Sparse file of zeros, all healthy
+            self.files.append(file)
+        self.current = 0 # Index of the file holding the current generation
+
+        self.infectCells(initialCells(populationMatrixSize, initialInfected, seed))
+
+        self.cases = self.countCases()
+        self.history = [self.report()]
+
+    def readLines(self, file, first, last):
+        lines = np.empty((last - first, self.size), dtype=np.uint8)
+        file.seek(first * self.size)
+        file.readinto(memoryview(lines).cast('B'))
+        return lines
+
+    def writeLines(self, file, first, lines, column=0):
+        file.seek(first * self.size + column)
+        file.write(memoryview(np.ascontiguousarray(lines)).cast('B'))
+
+    def infectCells(self, cells):
+        for cell in cells:
+            self.writeLines(self.files[self.current], cell // self.size, np.array([[SICK]], dtype=np.uint8), column=cell % self.size)
+
+    def stripes(self):
+        for first in range(0, self.size, self.stripeLines):
+            yield first, min(first + self.stripeLines, self.size)
+
+    @property
+    def population(self):
+        # Read-only map of the current grid, for images and inspection. The
+        # step itself never maps the whole grid.
+        self.files[self.current].flush()
+        return np.memmap(self.paths[self.current], dtype=np.uint8, mode='r', shape=(self.size, self.size))
+
+    def transientTransitions(self):
+        # Step of an infection-free grid (see VectorizedRandomWalkModel): the
+        # cells that can still change are kept stripe by stripe, and only
+        # the lines between the first and last of them are read, updated in
+        # place in the current file and written back. Stripes without any
+        # are not read at all. The cells and random draws are the same as in
+        # the full step, and so is the grid. Returns the change in the counts.
+        file = self.files[self.current]
+        if self.transient is None:
+            self.transient = []
+            for first, last in self.stripes():
+                lines = self.readLines(file, first, last)
+                self.transient.append(np.flatnonzero((lines != HEALTHY) & (lines != DEAD)) + first * self.size)
+        changes = np.zeros(len(State), dtype=np.int64)
+        visited = 0
+        for stripe, cells in enumerate(self.transient):
+            if cells.size == 0:
+                continue
+            first, last = int(cells[0]) // self.size, int(cells[-1]) // self.size + 1
+            lines = self.readLines(file, first, last)
+            local = cells - first * self.size
+            states = lines.ravel()[local]
+            nextStates = self.transitions.sampleTransitions(states, self.uniforms(TRANSITION, cells))
+            lines.ravel()[local] = nextStates
+            self.writeLines(file, first, lines)
+            changes += np.bincount(nextStates, minlength=len(State)) - np.bincount(states, minlength=len(State))
+            self.transient[stripe] = cells[(nextStates != HEALTHY) & (nextStates != DEAD)]
+            visited += cells.size
+        file.flush()
+        if self.instrumentation is not None:
+            self.instrumentation.count('cellsVisited', visited)
+            self.instrumentation.lap('transitions')
+        return changes
+
+    def nextGeneration(self):
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.startGeneration()
+        if self.infectionFree():
+            changes = self.transientTransitions()
+        else:
+            self.transient = None
+            source, target = self.files[self.current], self.files[1 - self.current]
+            changes = np.zeros(len(State), dtype=np.int64)
+            for first, last in self.stripes():
+                top = 1 if first > 0 else 0
+                block = self.readLines(source, first - top, min(last + 1, self.size))
+                stripe = block[top:top + last - first]
+                nextStripe = stripe.copy()
+                if instrumentation is not None:
+                    instrumentation.lap('copyBack')
+                states, nextStates = self.computeTransitions(stripe, nextStripe, first * self.size)
+                infected = self.computeInfections(nextStripe, block, top, first * self.size)
+                if instrumentation is not None:
+                    instrumentation.lap('socialInteractions')
+                self.writeLines(target, first, nextStripe)
+                changes += np.bincount(nextStates, minlength=len(State)) - np.bincount(states, minlength=len(State))
+                changes[HEALTHY] -= infected
+                changes[SICK] += infected
+            target.flush()
+            if instrumentation is not None:
+                instrumentation.lap('copyBack')
+            self.current = 1 - self.current
+
+        self.cases += changes
+        self.currentGeneration += 1
+        self.history.append(self.report())
+        if self.debug:
+            assert np.array_equal(self.cases, self.countCases()), f"running counts {self.cases} differ from the grid"
+        if instrumentation is not None:
+            instrumentation.lap('reporting')
+            instrumentation.finishGeneration(self)
+
+    def loadPopulation(self, codes):
+        # codes is an N x N array of state codes, or anything with N lines
+        # that can be sliced into stripes (e.g. a np.memmap of another grid).
+        for first, last in self.stripes():
+            lines = np.asarray(codes[first:last], dtype=np.uint8).reshape(last - first, self.size)
+            if lines.max() >= len(State):
+                raise ValueError(f"invalid state code {lines.max()}")
+            self.writeLines(self.files[self.current], first, lines)
+        self.transient = None
+        self.cases = self.countCases()
+        self.history = [self.report()]
+
+    def countCases(self):
+        cases = np.zeros(len(State), dtype=np.int64)
+        for first, last in self.stripes():
+            cases += np.bincount(self.readLines(self.files[self.current], first, last).ravel(), minlength=len(State))
+        return cases
+
+    def reset(self, seed=None, initialInfected=None):
+        # As VectorizedRandomWalkModel.reset(), without building the grid in
+        # memory: the current file is cut back to a sparse file of zeros
+        # (all healthy) and the sick cells are written into it.
+        self.rng = np.random.default_rng(seed)
+        if self.counter is not None:
+            self.counter = CounterRandom(seed)
+        self.currentGeneration = 0
+        file = self.files[self.current]
+        file.truncate(0)
+        file.truncate(self.size * self.size)
+        self.infectCells(initialCells(self.size, self.initialInfected if initialInfected is None else initialInfected, seed))
+        self.transient = None
+        self.cases = self.countCases()
+        self.history = [self.report()]
+
+    def getState(self):
+        # Everything but the grid itself, which stays on disk: gridPath is
+        # the file of the current generation, copied by saveModel next to
+        # the checkpoint. stripeLines is kept because the draws of the
+        # default random mode go stripe by stripe.
+        self.files[self.current].flush()
+        return {
+            'engine': 'tiled',
+            'size': self.size,
+            'stripeLines': self.stripeLines,
+            'currentGeneration': self.currentGeneration,
+            'gridPath': self.paths[self.current],
+            'history': self.history,
+            'random': self.rng.bit_generator.state,
+            'counter': self.counter.key if self.counter is not None else None,
+            'transitionProbabilities': self.transitionProbabilities,
+            'contagionFactor': self.contagionFactor,
+            'socialDistanceEffect': self.socialDistanceEffect,
+        }
+
+    def setState(self, state):
+        # state['grid'] is the saved grid, e.g. a np.memmap of its file.
+        self.loadPopulation(state['grid'])
+        self.currentGeneration = state['currentGeneration']
+        self.history = [list(report) for report in state['history']]
+        self.rng.bit_generator.state = state['random']
+        self.counter = CounterRandom.fromKey(state['counter']) if state.get('counter') else None
+        self.transitionProbabilities = state['transitionProbabilities']
+        self.contagionFactor = state['contagionFactor']
+        self.socialDistanceEffect = state['socialDistanceEffect']
+
+    def close(self):
+        for file in self.files:
+            file.close()
+        self.files = []
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
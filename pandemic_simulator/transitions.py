@@ -0,0 +1,52 @@
+import bisect
+import itertools
+import math
+
+import numpy as np
+
+class TransitionTable:
+    # Sampling tables built once from a transition matrix, shared by every
+    # engine. Row r holds the cumulative probabilities of leaving state r, so
+    # the next state for a uniform draw u is the first index whose cumulative
+    # probability reaches u, the same rule the original per-cell loop used.
+    def __init__(self, transitionProbabilities, numberOfStates):
+        self.probabilities = [list(row) for row in transitionProbabilities]
+        self.validate(numberOfStates)
+        self.cumulative = [list(itertools.accumulate(row)) for row in self.probabilities]
+        self.cumulativeArray = np.array(self.cumulative, dtype=float)
+
+    def validate(self, numberOfStates):
+        if len(self.probabilities) != numberOfStates:
+            raise ValueError(f"transition matrix has {len(self.probabilities)} rows, expected {numberOfStates}")
+        for state, row in enumerate(self.probabilities):
+            if len(row) != numberOfStates:
+                raise ValueError(f"row {state} of the transition matrix has {len(row)} entries, expected {numberOfStates}")
+            if any(probability < 0 for probability in row):
+                raise ValueError(f"row {state} of the transition matrix has a negative probability: {row}")
+            if not math.isclose(sum(row), 1.0, abs_tol=1e-9):
+                raise ValueError(f"row {state} of the transition matrix sums to {sum(row)}, not 1: {row}")
+
+    def sources(self, target):
+        # The states that can reach target (itself included) through a
+        # chain of transitions with positive probability.
+        sources = {target}
+        changed = True
+        while changed:
+            changed = False
+            for state, row in enumerate(self.probabilities):
+                if state not in sources and any(row[other] > 0 for other in sources):
+                    sources.add(state)
+                    changed = True
+        return sources
+
+    def sample(self, state, uniform):
+        # A draw above the last cumulative value (rounding) keeps the state.
+        cumulative = self.cumulative[state]
+        nextState = bisect.bisect_left(cumulative, uniform)
+        return nextState if nextState < len(cumulative) else state
+
+    def sampleTransitions(self, states, uniforms):
+        # Bulk version of sample() for arrays of state codes and draws.
+        states = np.asarray(states)
+        nextStates = (np.asarray(uniforms)[:, np.newaxis] > self.cumulativeArray[states]).sum(axis=1)
+        return np.where(nextStates < len(self.cumulative), nextStates, states).astype(np.uint8)
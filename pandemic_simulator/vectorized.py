@@ -0,0 +1,332 @@
+import os
+
+import numpy as np
+
+from .model import DEAD, HEALTHY, SICK, BaseRandomWalkModel, State, initialCells
+from .philox import INFECTION, TRANSITION, CounterRandom, escapeProbabilities
+
+# Moore neighbours of a cell, split by whether the object engine visits them
+# before or after the cell itself in its row-major sweep.
+EARLIER_NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, -1)]
+LATER_NEIGHBOURS = [(0, 1), (1, -1), (1, 0), (1, 1)]
+
+def neighbourCounts(sick):
+    # Counts sick Moore neighbours of every cell with shifted views of a
+    # zero-padded copy of the grid (the last two axes; any leading axes are
+    # independent replicas). Returns the count over all eight neighbours and
+    # the count over the ones visited later in the sweep.
+    lines, columns = sick.shape[-2:]
+    padded = np.zeros(sick.shape[:-2] + (lines + 2, columns + 2), dtype=np.uint8)
+    padded[..., 1:-1, 1:-1] = sick
+
+    def shifted(di, dj):
+        return padded[..., 1 + di:1 + di + lines, 1 + dj:1 + dj + columns]
+
+    later = sum(shifted(di, dj) for di, dj in LATER_NEIGHBOURS)
+    earlier = sum(shifted(di, dj) for di, dj in EARLIER_NEIGHBOURS)
+    return earlier + later, later
+
+class VectorizedRandomWalkModel(BaseRandomWalkModel):
+    # Same model as RandomWalkModel, but the grid is a uint8 array of state
+    # codes and every generation is computed with whole-grid array operations.
+    #
+    # Each contact of a sick cell with a neighbour infects it with probability
+    # (1 - socialDistanceEffect) * contagionFactor, independently of the other
+    # contacts, so a cell exposed to k sick neighbours escapes with probability
+    # (1 - p) ** k. As in the object engine, healthy cells can be infected by
+    # any sick neighbour, while a cell that only becomes healthy in this
+    # generation can still be infected by the neighbours swept after it.
+    #
+    # With synchronous=True, the draws are keyed by generation and cell and
+    # a cell that has just recovered is exposed to all its sick neighbours,
+    # as in RandomWalkModel(synchronous=True); both give the same grid for
+    # the same seed.
+    def __init__(self, populationMatrixSize, seed=None, debug=False, synchronous=False, initialInfected=None):
+        self.initModel(seed, debug, synchronous, initialInfected)
+        self.population = np.full((populationMatrixSize, populationMatrixSize), HEALTHY, dtype=np.uint8)
+        self.rng = np.random.default_rng(seed)
+        self.transient = None # Indices of the cells that can still change, once infection-free
+
+        self.population.flat[initialCells(populationMatrixSize, initialInfected, seed)] = SICK
+        self.nextPopulation = self.population.copy() # Buffer written by the next generation
+
+        # Running count of every state, updated from the cells that change in
+        # each generation, and the counts at the end of every generation.
+        self.cases = self.countCases()
+        self.history = [self.report()]
+
+    def uniforms(self, purpose, cells):
+        # One draw per cell, from the model's stream or, in synchronous mode,
+        # keyed by generation and by the cells' flat indices in the grid.
+        if self.counter is None:
+            return self.rng.random(cells.size)
+        return self.counter.uniforms(self.currentGeneration, purpose, cells)
+
+    def computeTransitions(self, population, nextPopulation, offset=0):
+        # Samples the next state of every cell of population that can change
+        # on its own into nextPopulation. Returns their old and new states.
+        # offset is the flat index in the grid of population's first cell.
+        active = np.flatnonzero((population != HEALTHY) & (population != DEAD))
+        states = population.ravel()[active]
+        nextStates = self.transitions.sampleTransitions(states, self.uniforms(TRANSITION, active + offset))
+        nextPopulation.ravel()[active] = nextStates
+        if self.instrumentation is not None:
+            self.instrumentation.count('cellsVisited', active.size)
+            self.instrumentation.lap('transitions')
+        return states, nextStates
+
+    def computeInfections(self, nextPopulation, population=None, top=0, offset=0):
+        # Infects the healthy cells of nextPopulation in place and returns how
+        # many. population is the current grid by default; a stripe of it may
+        # carry `top` halo rows above nextPopulation's rows and one below,
+        # which only take part as neighbours. offset is the flat index in the
+        # grid of nextPopulation's first cell.
+        population = self.population if population is None else population
+        sick = population == SICK
+        if not sick.any():
+            return 0
+        rows = slice(top, top + nextPopulation.shape[-2])
+        allNeighbours, laterNeighbours = (counts[..., rows, :] for counts in neighbourCounts(sick))
+        population = population[..., rows, :]
+        if self.counter is not None:
+            exposures = np.where(nextPopulation == HEALTHY, allNeighbours, 0)
+        else:
+            recovered = (population != HEALTHY) & (nextPopulation == HEALTHY)
+            exposures = np.where(population == HEALTHY, allNeighbours, 0)
+            exposures = np.where(recovered, laterNeighbours, exposures)
+
+        exposed = np.flatnonzero(exposures)
+        if self.counter is not None:
+            escape = np.array(escapeProbabilities(self.contagionFactor, self.socialDistanceEffect))[exposures.ravel()[exposed]]
+        else:
+            contagion = (1 - self.socialDistanceEffect) * self.contagionFactor
+            escape = (1 - contagion) ** exposures.ravel()[exposed]
+        infected = exposed[self.uniforms(INFECTION, exposed + offset) >= escape]
+        nextPopulation.ravel()[infected] = SICK
+        if self.instrumentation is not None:
+            self.instrumentation.count('contactsAttempted', int(allNeighbours.sum()))
+            self.instrumentation.count('infections', infected.size)
+        return infected.size
+
+    def transientTransitions(self):
+        # Step of an infection-free grid: only the cells that are neither
+        # healthy nor dead can change, each on its own, so they are updated
+        # in place from a list of their indices kept between generations
+        # (without the grid copy and scans of the full step). The cells and
+        # random draws are the same as in the full step, and so is the grid.
+        cells = self.population.reshape(-1)
+        if self.transient is None:
+            self.transient = np.flatnonzero((cells != HEALTHY) & (cells != DEAD))
+        states = cells[self.transient]
+        nextStates = self.transitions.sampleTransitions(states, self.uniforms(TRANSITION, self.transient))
+        cells[self.transient] = nextStates
+        if self.instrumentation is not None:
+            self.instrumentation.count('cellsVisited', self.transient.size)
+            self.instrumentation.lap('transitions')
+        self.transient = self.transient[(nextStates != HEALTHY) & (nextStates != DEAD)]
+        return states, nextStates
+
+    def nextGeneration(self):
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.startGeneration()
+        if self.infectionFree():
+            states, nextStates = self.transientTransitions()
+            infected = 0
+        else:
+            self.transient = None
+            nextPopulation = self.nextPopulation
+            np.copyto(nextPopulation, self.population)
+            if instrumentation is not None:
+                instrumentation.lap('copyBack')
+            states, nextStates = self.computeTransitions(self.population, nextPopulation)
+            infected = self.computeInfections(nextPopulation)
+            if instrumentation is not None:
+                instrumentation.lap('socialInteractions')
+            self.population, self.nextPopulation = nextPopulation, self.population
+
+        self.cases += np.bincount(nextStates, minlength=len(State)) - np.bincount(states, minlength=len(State))
+        self.cases[HEALTHY] -= infected
+        self.cases[SICK] += infected
+        self.currentGeneration += 1
+        self.history.append(self.report())
+        if self.debug:
+            assert np.array_equal(self.cases, self.countCases()), f"running counts {self.cases} differ from the grid"
+        if instrumentation is not None:
+            instrumentation.lap('reporting')
+            instrumentation.finishGeneration(self)
+
+    def loadPopulation(self, codes):
+        # Replaces the grid with state codes of shape N x N (or N * N in row
+        # order; the batched model copies them into every replica) and
+        # restarts the counts and history from it.
+        lines, columns = self.population.shape[-2:]
+        codes = np.asarray(codes, dtype=np.uint8).reshape(lines, columns)
+        if codes.max() >= len(State):
+            raise ValueError(f"invalid state code {codes.max()}")
+        self.population[...] = codes
+        np.copyto(self.nextPopulation, self.population)
+        self.transient = None
+        self.cases = self.countCases()
+        self.history = [self.report()]
+
+    def startingCells(self, initialInfected, seed):
+        # Flat indices of the cells that start sick (see initialCells).
+        return initialCells(self.population.shape[-1], initialInfected, seed)
+
+    def reset(self, seed=None, initialInfected=None):
+        # Restores the initial condition in place for another run, as if the
+        # model had just been built with this seed and initialInfected (by
+        # default the one it was built with; CENTRE for the centre cell), in
+        # every replica for the batched model. The arrays are reused, and
+        # the parameters and the synchronous mode are kept.
+        self.rng = np.random.default_rng(seed)
+        if self.counter is not None:
+            self.counter = CounterRandom(seed)
+        self.currentGeneration = 0
+        codes = np.full(self.population.shape[-2:], HEALTHY, dtype=np.uint8)
+        codes.flat[self.startingCells(self.initialInfected if initialInfected is None else initialInfected, seed)] = SICK
+        self.loadPopulation(codes)
+
+    def getState(self):
+        # Everything a run needs to continue exactly where it stopped (see
+        # checkpoint.py).
+        return {
+            'engine': 'vectorized',
+            'size': self.population.shape[-1],
+            'currentGeneration': self.currentGeneration,
+            'population': self.population.copy(),
+            'history': self.history,
+            'random': self.rng.bit_generator.state,
+            'counter': self.counter.key if self.counter is not None else None,
+            'transitionProbabilities': self.transitionProbabilities,
+            'contagionFactor': self.contagionFactor,
+            'socialDistanceEffect': self.socialDistanceEffect,
+        }
+
+    def setState(self, state):
+        self.population[...] = state['population']
+        np.copyto(self.nextPopulation, self.population)
+        self.transient = None
+        self.currentGeneration = state['currentGeneration']
+        self.history = [list(report) for report in state['history']]
+        self.rng.bit_generator.state = state['random']
+        self.counter = CounterRandom.fromKey(state['counter']) if state.get('counter') else None
+        self.transitionProbabilities = state['transitionProbabilities']
+        self.contagionFactor = state['contagionFactor']
+        self.socialDistanceEffect = state['socialDistanceEffect']
+        self.cases = self.countCases()
+
+    def countCases(self):
+        # Totals over the whole array (all replicas, for the batched model).
+        return np.bincount(self.population.ravel(), minlength=len(State)).astype(np.int64)
+
+    def report(self):
+        return self.cases.tolist()
+
+    def image(self):
+        from .images import gridImage
+        lines, columns = self.population.shape
+        return gridImage(self.population, columns, lines)
+
+class BatchedRandomWalkModel(VectorizedRandomWalkModel):
+    # Advances numberOfReplicas independent runs together: the population is
+    # a (replicas x N x N) array and every step of the vectorized engine
+    # already works element-wise, so one call moves all of them forward.
+    # The running counts are totals over all replicas, so report() still
+    # counts each replica from the grid. In synchronous mode, the cells of
+    # replica r are keyed after those of replicas 0 .. r - 1, so every
+    # replica draws its own numbers and replica 0 is the single-grid run.
+    def __init__(self, numberOfReplicas, populationMatrixSize, seed=None, debug=False, synchronous=False, initialInfected=None):
+        super().__init__(populationMatrixSize, seed, debug, synchronous, initialInfected)
+        self.population = np.repeat(self.population[np.newaxis], numberOfReplicas, axis=0)
+        self.nextPopulation = self.population.copy()
+        self.cases = self.countCases()
+        self.history = [self.report()]
+
+    def report(self):
+        # One row of state counts per replica.
+        replicas = self.population.shape[0]
+        codes = self.population.reshape(replicas, -1) + (np.arange(replicas) * len(State))[:, np.newaxis]
+        return np.bincount(codes.ravel(), minlength=replicas * len(State)).reshape(replicas, len(State))
+
+    def getState(self):
+        state = super().getState()
+        state['engine'] = 'batched'
+        state['replicas'] = self.population.shape[0]
+        return state
+
+    def setState(self, state):
+        super().setState(state)
+        self.history = [np.asarray(report) for report in state['history']]
+
+    def printReport(self, report):
+        super().printReport(np.rint(report.mean(axis=0)).astype(int).tolist())
+
+    def numberOfDeaths(self):
+        return np.count_nonzero(self.population == DEAD, axis=(1, 2))
+
+    def image(self, replica=0):
+        from .images import gridImage
+        lines, columns = self.population.shape[1:]
+        return gridImage(self.population[replica], columns, lines)
+
+    def printImage(self, name):
+        for replica in range(self.population.shape[0]):
+            self.image(replica).save(f"./images/simulation-{name}-{replica}.png")
+
+DEFAULT_BATCH_SIZE = 100
+
+def simulateRuns(numberOfRuns, populationMatrixSize, generations, batchSize=DEFAULT_BATCH_SIZE, seed=None, writer=None, scenario=None, checkpoint=None):
+    # Runs numberOfRuns simulations batchSize replicas at a time, so memory
+    # stays around batchSize * populationMatrixSize ** 2 bytes per state
+    # array. Returns the final report() of every run as a (runs x states)
+    # array; the deaths of each run are its State.dead column. The history
+    # of every run is streamed to writer, if given, after each batch. A
+    # Scenario, if given, sets the model parameters. With a BatchCheckpoint,
+    # each batch is saved as it goes (under the number of its first run) and
+    # a resumed call continues from the first unfinished batch.
+    from .checkpoint import advance, loadModel
+
+    reports = np.empty((numberOfRuns, len(State)), dtype=np.int64)
+    finished = 0
+    if checkpoint is not None:
+        settings = {
+            'numberOfRuns': numberOfRuns,
+            'populationMatrixSize': populationMatrixSize,
+            'generations': generations,
+            'engine': 'batched',
+            'batchSize': batchSize,
+            'scenario': scenario.toDict() if scenario is not None else None,
+        }
+        rows, seed = checkpoint.start(settings, seed, batchSize)
+        finished = len(rows)
+        reports[:finished] = np.array(rows, dtype=np.int64).reshape(finished, len(State))
+    batches = range(0, numberOfRuns, batchSize)
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+    batchModel = None # Reset for every batch of the same size
+    for start, batchSeed in zip(batches, seeds):
+        if start < finished:
+            continue
+        size = min(batchSize, numberOfRuns - start)
+        path = checkpoint.runPath(start + 1) if checkpoint is not None else None
+        if path is not None and os.path.exists(path):
+            model = loadModel(path)
+        elif batchModel is not None and batchModel.population.shape[0] == size:
+            model = batchModel
+            model.reset(batchSeed)
+        else:
+            model = batchModel = BatchedRandomWalkModel(size, populationMatrixSize, batchSeed)
+            if scenario is not None:
+                scenario.apply(model)
+        if checkpoint is None:
+            model.simulation(generations)
+        else:
+            advance(model, generations, path, checkpoint.every)
+        reports[start:start + size] = model.report()
+        if writer is not None:
+            for replica, history in enumerate(np.stack(model.history, axis=1)):
+                writer.writeRun(start + replica + 1, history)
+        if checkpoint is not None:
+            checkpoint.complete(start + 1, *reports[start:start + size].tolist())
+    return reports
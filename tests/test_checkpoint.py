@@ -0,0 +1,38 @@
+import numpy as np
+
+from pandemic_simulator import ContactNetwork, DecomposedRandomWalkModel, NetworkRandomWalkModel
+from pandemic_simulator.checkpoint import loadModel, saveModel
+
+# A model saved part-way and loaded again must end the run exactly like one
+# that never stopped.
+
+def test_decomposed_checkpoint_resumes_the_same_run(tmp_path):
+    path = str(tmp_path / 'run.npz')
+    with DecomposedRandomWalkModel(40, workers=2, seed=5) as model:
+        for _ in range(10):
+            model.nextGeneration()
+        saveModel(path, model)
+        for _ in range(10):
+            model.nextGeneration()
+        expected = model.population.copy()
+        history = model.history
+    with loadModel(path) as model:
+        for _ in range(10):
+            model.nextGeneration()
+        assert np.array_equal(model.population, expected)
+        assert model.history == history
+
+def test_network_checkpoint_resumes_the_same_run(tmp_path):
+    path = str(tmp_path / 'run.npz')
+    network = ContactNetwork.grid(30)
+    model = NetworkRandomWalkModel(network, seed=2)
+    for _ in range(10):
+        model.nextGeneration()
+    saveModel(path, model)
+    for _ in range(10):
+        model.nextGeneration()
+    resumed = loadModel(path, network)
+    for _ in range(10):
+        resumed.nextGeneration()
+    assert np.array_equal(resumed.population, model.population)
+    assert resumed.history == model.history
@@ -0,0 +1,6 @@
+from pandemic_simulator.parallel import adaptiveRuns, parallelRuns
+
+def test_adaptiveRuns_matches_parallelRuns_run_by_run():
+    rows = adaptiveRuns(21, 10, tolerance=1e9, minimumRuns=15, roundSize=5, seed=3, workers=1)
+    assert len(rows) == 15
+    assert rows == parallelRuns(15, 21, 10, seed=3, workers=1)
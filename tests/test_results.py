@@ -0,0 +1,13 @@
+from pandemic_simulator import CsvTimeSeriesWriter, readTimeSeries
+
+def test_csv_time_series_skips_and_trims_a_partial_last_line(tmp_path):
+    path = str(tmp_path / 'runs.csv')
+    with CsvTimeSeriesWriter(path) as writer:
+        writer.writeRun(1, [[99, 2, 0, 0, 0], [98, 3, 0, 0, 0]])
+    with open(path, 'a') as file:
+        file.write('2,0,99,2,0,0,') # Cut right after its last comma
+    assert readTimeSeries(path).tolist() == [[1, 0, 99, 2, 0, 0, 0], [1, 1, 98, 3, 0, 0, 0]]
+
+    with CsvTimeSeriesWriter(path) as writer: # A resumed batch
+        writer.writeRun(2, [[97, 4, 0, 0, 0]])
+    assert readTimeSeries(path)[:, 0].tolist() == [1, 1, 2]
@@ -0,0 +1,21 @@
+from pandemic_simulator import loadScenario
+from pandemic_simulator.compare import pairedRuns
+from pandemic_simulator.parallel import runChunk, runSeeds
+
+# In synchronous mode every engine draws the same counter-based numbers for
+# a seed, so the runners must give the same rows whatever the engine.
+
+def test_runChunk_synchronous_rows_match_across_engines():
+    scenario = loadScenario('lockdown')
+    seeds = runSeeds(4, 7)
+    rows = [
+        [row for row, _, _ in runChunk(41, 20, seeds, vectorized, scenario=scenario, synchronous=True)]
+        for vectorized in (False, True)
+    ]
+    assert rows[0] == rows[1]
+
+def test_pairedRuns_synchronous_rows_match_across_engines():
+    scenarios = [loadScenario('lockdown')]
+    objectRows = pairedRuns(scenarios, 3, 41, 20, seed=1, workers=1, vectorized=False, synchronous=True)
+    vectorizedRows = pairedRuns(scenarios, 3, 41, 20, seed=1, workers=1, vectorized=True, synchronous=True)
+    assert objectRows == vectorizedRows